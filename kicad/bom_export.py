@@ -3,10 +3,14 @@
 
 """FSDKFJSLDKF"""
 
+import argparse
+import csv
+import json
 import sys
 import os
 import re
 import xml.etree.ElementTree as ET
+from xml.sax.saxutils import escape
 
 
 def get_footprint(component_element):
@@ -18,7 +22,7 @@ def get_footprint(component_element):
     except IndexError:
         footprint = ""
 
-    return footprint
+    return footprint or ""
 
 
 def get_refdes(component_element):
@@ -38,7 +42,7 @@ def get_value(component_element):
     except IndexError:
         value = ""
 
-    return value
+    return value or ""
 
 
 def get_fields(component_element):
@@ -48,19 +52,28 @@ def get_fields(component_element):
     result = {}
     for fields_element in component_element.findall("fields"):
         for field in fields_element.findall("field"):
-            value = field.text
+            value = field.text or ""
             name = field.attrib['name']
             result[name] = value
     return result
 
 
-def get_components(xml_file):
-    """ Returns a list of all components in the design, each represented as
-    a dict. """
+def parse_netlist(xml_file):
+    """ Parses a KiCAD XML netlist and returns its root element. """
 
     xml_file = os.path.abspath(os.path.normpath(xml_file))
     tree = ET.parse(xml_file)
-    root = tree.getroot()
+    return tree.getroot()
+
+
+def get_components(xml_file, root=None):
+    """ Returns a list of all components in the design, each represented as
+    a dict. An already-parsed netlist root can be supplied instead of
+    re-reading the file. """
+
+    if root is None:
+        root = parse_netlist(xml_file)
+
     component_elements = root.findall('components')[0].findall("*")
     results = []
 
@@ -77,6 +90,33 @@ def get_components(xml_file):
     return results
 
 
+def get_nets(xml_file, root=None):
+    """ Returns a dict mapping each net name in the design to a frozenset of
+    its (refdes, pin) nodes. An already-parsed netlist root can be supplied
+    instead of re-reading the file. """
+
+    if root is None:
+        root = parse_netlist(xml_file)
+
+    results = {}
+    for nets_element in root.findall('nets'):
+        for net in nets_element.findall('net'):
+            nodes = [(x.attrib['ref'], x.attrib['pin'])
+                     for x in net.findall('node')]
+            results[net.attrib['name']] = frozenset(nodes)
+
+    return results
+
+
+def component_fingerprint(component):
+    """ Returns a hashable fingerprint of a component: every field except
+    its reference designator, in sorted order. Components with equal
+    fingerprints are grouped onto the same BOM line. """
+
+    return tuple(sorted((key, value) for key, value in component.items()
+                        if key != 'refdes'))
+
+
 def sort_refdes_string(refdes_string):
     """ Accepts a comma-separated string of reference designators, splits it
     into a list, sorts the list, and reassembles it into a string. """
@@ -101,89 +141,210 @@ def sort_refdes_string(refdes_string):
 
 def group_items(components):
     """ Groups identical components from a list of individual components (as
-    emitted by the get_components function). The resulting list is ordered
-    alphabetically. """
+    emitted by the get_components function). Yields one line dict per group,
+    ordered alphabetically by reference designators. Grouping needs every
+    component, so only the groups' refdes lists are held in memory; each
+    line dict is built as it is yielded. """
 
     line_dict = {}
     for component in components:
-        refdes = component.pop('refdes')
+        descriptor = component_fingerprint(component)
+        line_dict.setdefault(descriptor, []).append(component['refdes'])
 
-        descriptor = ""
-        for key in sorted(component.keys()):
-            descriptor += "%s\f%s\t" % (key, component[key])
+    order = sorted((sort_refdes_string(','.join(refdes)), key)
+                   for key, refdes in line_dict.items())
 
-        descriptor = descriptor[:-1]
-        if descriptor not in line_dict.keys():
-            line_dict[descriptor] = []
+    for refdes_string, key in order:
+        fields = dict(key)
+        fields['refdes'] = refdes_string
+        fields['quantity'] = str(len(line_dict[key]))
+        yield fields
 
-        line_dict[descriptor] = line_dict[descriptor] + [refdes]
 
-    bom_list = []
-    for key in line_dict.keys():
-        params = key.split('\t')
-        params = [x.split('\f') for x in params]
+BOM_COLUMNS = [
+    ['Line Item', ['bom_index']],
+    ['Quantity', ['quantity']],
+    ['Reference Designator', ['refdes']],
+    ['Description', ['Description', 'value']],
+    ['Value', ['value']],
+    ['Manufacturer', ['Manufacturer']],
+    ['Manufacturer PN', ['Manufacturer PN']],
+    ['Footprint', ['footprint']],
+]
 
-        fields = {}
-        for param in params:
-            fields[param[0]] = param[1]
 
-        refdes_string = ','.join(line_dict[key])
-        quantity = len(line_dict[key])
-        fields['refdes'] = sort_refdes_string(refdes_string)
-        fields['quantity'] = str(quantity)
-        bom_list.append(fields)
+def compile_columns(columns):
+    """ Compiles a column spec (a list of [header, [keys...]] entries) into
+    a list of (header, extractor) pairs. Each extractor takes a BOM line
+    and its 1-based line number, and returns the value of the first key
+    present in the line, or an empty string if none are. The 'bom_index'
+    key is the line number itself. """
 
-    bom_list = [[x['refdes'], x] for x in bom_list]
-    bom_list = [x[1] for x in sorted(bom_list)]
-    return bom_list
+    def make_extractor(keys):
+        """ Builds the extractor function for one column. """
 
+        if keys == ['bom_index']:
+            return lambda line, number: str(number)
+
+        if len(keys) == 1:
+            key = keys[0]
+            return lambda line, number: line.get(key, "")
+
+        def extractor(line, number):
+            """ Returns the first of several fallback fields. """
+            for key in keys:
+                if key in line:
+                    return line[key]
+            return ""
+        return extractor
+
+    return [(header, make_extractor(keys)) for header, keys in columns]
+
+
+def iter_bom_rows(line_items, extractors):
+    """ Yields one list of cell values per BOM line, numbering the lines as
+    they go. The line dicts themselves are not modified. """
+
+    for number, line in enumerate(line_items, 1):
+        yield [extractor(line, number) for header, extractor in extractors]
+
+
+def write_tsv(handle, headers, rows):
+    """ Writes BOM rows as tab-separated text. """
+
+    handle.write('\t'.join(headers) + "\n")
+    for row in rows:
+        handle.write('\t'.join(row) + "\n")
+
+
+def write_csv(handle, headers, rows):
+    """ Writes BOM rows as comma-separated values. """
+
+    writer = csv.writer(handle, lineterminator="\n")
+    writer.writerow(headers)
+    for row in rows:
+        writer.writerow(row)
 
-def main():
-    """ Main BOM generation routine. """
 
-    infile = os.path.abspath(os.path.normpath(sys.argv[1]))
-    outfile = os.path.abspath(os.path.normpath(sys.argv[2]))
+def write_jsonl(handle, headers, rows):
+    """ Writes BOM rows as JSON Lines (one object per line). """
 
-    if outfile[-4:].lower() != ".txt":
-        outfile += ".txt"
+    for row in rows:
+        handle.write(json.dumps(dict(zip(headers, row))) + "\n")
 
-    components = get_components(infile)
-    line_items = group_items(components)
 
-    # pylint: disable=consider-using-enumerate
-    for count in range(len(line_items)):
-        line_items[count]['bom_index'] = str(count + 1)
+def write_xml(handle, headers, rows):
+    """ Writes BOM rows as an Excel-compatible XML Spreadsheet 2003 file.
+    Purely numeric cells are typed as numbers. """
 
-    fields = [['Line Item', ['bom_index']]]
-    fields.append(['Quantity', ['quantity']])
-    fields.append(['Reference Designator', ['refdes']])
-    fields.append(['Description', ['Description', 'value']])
-    fields.append(['Value', ['value']])
-    fields.append(['Manufacturer', ['Manufacturer']])
-    fields.append(['Manufacturer', ['Manufacturer PN']])
-    fields.append(['Footprint', ['footprint']])
+    def write_row(row):
+        """ Writes a single spreadsheet row. """
+        handle.write("   <Row>\n")
+        for value in row:
+            cell_type = "Number" if value.isdigit() else "String"
+            handle.write('    <Cell><Data ss:Type="%s">%s</Data></Cell>\n' %
+                         (cell_type, escape(value)))
+        handle.write("   </Row>\n")
 
-    result_lines = []
-    result_lines.append('\t'.join([field[0] for field in fields]))
+    handle.write('<?xml version="1.0"?>\n')
+    handle.write('<?mso-application progid="Excel.Sheet"?>\n')
+    handle.write('<Workbook xmlns="urn:schemas-microsoft-com:office:'
+                 'spreadsheet"\n xmlns:ss="urn:schemas-microsoft-com:'
+                 'office:spreadsheet">\n')
+    handle.write(' <Worksheet ss:Name="BOM">\n  <Table>\n')
 
-    for line in line_items:
-        values = []
-        for field in fields:
-            value = ""
-            for index in field[1]:
-                if index in line.keys():
-                    value = line[index]
-                    break
-            values.append(value)
-        result_lines.append('\t'.join(values))
+    write_row(headers)
+    for row in rows:
+        write_row(row)
 
-    result = "\n".join(result_lines)
+    handle.write('  </Table>\n </Worksheet>\n</Workbook>\n')
+
+
+BOM_WRITERS = {
+    'tsv': [write_tsv, '.txt'],
+    'csv': [write_csv, '.csv'],
+    'jsonl': [write_jsonl, '.jsonl'],
+    'xml': [write_xml, '.xml'],
+}
+
+
+class EchoHandle(object):
+    """ File-like wrapper that copies everything written to it onto
+    stdout. """
+
+    def __init__(self, handle):
+        self.handle = handle
+
+    def write(self, data):
+        """ Writes data to both the wrapped handle and stdout. """
+        sys.stdout.write(data)
+        self.handle.write(data)
+
+
+def write_bom(outfile, line_items, quiet=False, output_format='tsv',
+              columns=None):
+    """ Writes grouped BOM lines (as produced by group_items) to a file, one
+    row at a time. The format's extension is added to 'outfile' if it's
+    missing. The BOM is also echoed to stdout unless 'quiet' is set.
+    Returns the path of the file that was written. """
+
+    writer, extension = BOM_WRITERS[output_format]
+    outfile = os.path.abspath(os.path.normpath(outfile))
+
+    if outfile[-len(extension):].lower() != extension:
+        outfile += extension
+
+    extractors = compile_columns(columns or BOM_COLUMNS)
+    headers = [header for header, extractor in extractors]
 
     with open(outfile, 'w') as handle:
-        sys.stdout.write(result + "\n")
-        handle.write(result + "\n")
+        if not quiet:
+            handle = EchoHandle(handle)
+        writer(handle, headers, iter_bom_rows(line_items, extractors))
+
+    return outfile
+
+
+def export_bom(infile, outfile, quiet=False, output_format='tsv',
+               columns=None):
+    """ Reads a KiCAD XML netlist and writes a grouped BOM to the requested
+    output file. Returns the path of the file that was written. """
+
+    infile = os.path.abspath(os.path.normpath(infile))
+    line_items = group_items(get_components(infile))
+    return write_bom(outfile, line_items, quiet, output_format, columns)
+
+
+def make_parser():
+    """ Creates the CLI's argparse instance. """
+
+    description = """Script for generating a grouped bill of materials from
+    a KiCAD XML netlist. """
+
+    parser = argparse.ArgumentParser(description=description)
+
+    parser.add_argument('infile', metavar="NETLIST",
+                        help="KiCAD XML netlist to read.")
+
+    parser.add_argument('outfile', metavar="OUTFILE",
+                        help="BOM file to write. The format's extension " +
+                        "is added if missing.")
+
+    parser.add_argument('-f', '--format', default='tsv',
+                        choices=sorted(BOM_WRITERS.keys()),
+                        help="Output format (default: tsv)")
+
+    parser.add_argument('-q', '--quiet', default=False, action="store_true",
+                        help="Don't echo the BOM to stdout.")
+
+    return parser
+
+
+def main():
+    """ Main BOM generation routine. """
 
-    return
+    args = make_parser().parse_args()
+    export_bom(args.infile, args.outfile, args.quiet, args.format)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+
+""" Compares two revisions of a KiCAD XML netlist and prints an ECO report:
+added, removed, renamed and changed components, plus added, removed, renamed
+and changed nets. All comparisons are dictionary (hash) joins, so the run
+time grows linearly with the size of the design. """
+
+import re
+import sys
+import os
+
+import bom_export
+
+
+def is_auto_net(net_name):
+    """ Returns True for KiCAD's auto-generated net names, which embed a
+    reference designator (e.g. 'Net-(R1-Pad2)') and so change whenever a
+    part is renamed. """
+
+    return net_name.startswith("Net-(") or net_name.startswith("/Net-(")
+
+
+def get_pin_nets(nets):
+    """ Inverts a net -> nodes mapping into a refdes -> [(pin, net)] mapping.
+    Auto-generated net names are replaced with a placeholder so that they
+    don't defeat rename detection. """
+
+    pin_nets = {}
+    for net_name, nodes in nets.items():
+        if is_auto_net(net_name):
+            net_name = "\f"
+        for refdes, pin in nodes:
+            pin_nets.setdefault(refdes, []).append((pin, net_name))
+    return pin_nets
+
+
+def connectivity_key(component, pin_nets):
+    """ Returns a hashable key identifying a component by its fields and
+    connections, but not its reference designator. """
+
+    pins = tuple(sorted(pin_nets.get(component['refdes'], [])))
+    return (bom_export.component_fingerprint(component), pins)
+
+
+def pin_key(refdes, pin_nets):
+    """ Returns a hashable key identifying a component by its reference
+    prefix (e.g. 'R') and connections only. """
+
+    prefix = re.match("[^0-9]*", refdes).group(0)
+    return (prefix, tuple(sorted(pin_nets.get(refdes, []))))
+
+
+def match_components(old_components, new_components, old_pin_nets,
+                     new_pin_nets):
+    """ Pairs every old component with its counterpart in the new revision.
+    Components are first matched by connectivity key across both whole
+    revisions, so re-annotations that swap or shuffle existing reference
+    designators are found; only unambiguous (one-to-one) keys are used.
+    Whatever is left is matched by unchanged reference designator, and
+    finally by reference prefix and connections alone. Returns a dict
+    mapping old refdes -> new refdes. """
+
+    old_keys = {}
+    for component in old_components.values():
+        key = connectivity_key(component, old_pin_nets)
+        old_keys.setdefault(key, []).append(component['refdes'])
+
+    new_keys = {}
+    for component in new_components.values():
+        key = connectivity_key(component, new_pin_nets)
+        new_keys.setdefault(key, []).append(component['refdes'])
+
+    matches = {}
+    for key, old_refs in old_keys.items():
+        new_refs = new_keys.get(key, [])
+        if len(old_refs) == 1 and len(new_refs) == 1:
+            matches[old_refs[0]] = new_refs[0]
+
+    claimed = set(matches.values())
+    for refdes in old_components:
+        if refdes not in matches and refdes in new_components and \
+                refdes not in claimed:
+            matches[refdes] = refdes
+            claimed.add(refdes)
+
+    # Renamed parts that were also edited only share their connections.
+    old_pins = {}
+    for refdes in set(old_components) - set(matches):
+        key = pin_key(refdes, old_pin_nets)
+        if key[1]:
+            old_pins.setdefault(key, []).append(refdes)
+
+    new_pins = {}
+    for refdes in set(new_components) - claimed:
+        key = pin_key(refdes, new_pin_nets)
+        if key[1]:
+            new_pins.setdefault(key, []).append(refdes)
+
+    for key, old_refs in old_pins.items():
+        new_refs = new_pins.get(key, [])
+        if len(old_refs) == 1 and len(new_refs) == 1:
+            matches[old_refs[0]] = new_refs[0]
+
+    return matches
+
+
+def diff_components(old_components, new_components, matches):
+    """ Compares the fields of every component present in both revisions,
+    as paired by match_components. Returns a list of (old refdes, new
+    refdes, [(field, old value, new value)]) tuples. """
+
+    changes = []
+    for old_ref, new_ref in sorted(matches.items()):
+        old = old_components[old_ref]
+        new = new_components[new_ref]
+
+        if bom_export.component_fingerprint(old) == \
+                bom_export.component_fingerprint(new):
+            continue
+
+        fields = []
+        for key in sorted(set(old) | set(new)):
+            if key != 'refdes' and old.get(key, "") != new.get(key, ""):
+                fields.append((key, old.get(key, ""), new.get(key, "")))
+        changes.append((old_ref, new_ref, fields))
+
+    return changes
+
+
+def diff_nets(old_nets, new_nets, renames):
+    """ Compares net connectivity between two revisions. Old nodes are
+    translated through the refdes rename map first, so renamed parts don't
+    show up as connection changes. Nets are paired by unchanged name and
+    nodes, then by identical nodes (a renamed net, including auto-generated
+    names that follow a renamed part), then by name alone. Returns a dict
+    of 'added', 'removed', 'renamed' and 'changed' results. """
+
+    remapped = {}
+    for name, nodes in old_nets.items():
+        remapped[name] = frozenset((renames.get(ref, ref), pin)
+                                   for ref, pin in nodes)
+
+    matched = {}
+    for name, nodes in remapped.items():
+        if new_nets.get(name) == nodes:
+            matched[name] = name
+    claimed = set(matched.values())
+
+    new_by_nodes = {}
+    for name, nodes in new_nets.items():
+        if name not in claimed:
+            new_by_nodes.setdefault(nodes, []).append(name)
+
+    for name in sorted(set(remapped) - set(matched)):
+        names = [x for x in new_by_nodes.get(remapped[name], [])
+                 if x not in claimed]
+        if len(names) == 1:
+            matched[name] = names[0]
+            claimed.add(names[0])
+
+    for name in sorted(set(remapped) - set(matched)):
+        if name in new_nets and name not in claimed:
+            matched[name] = name
+            claimed.add(name)
+
+    renamed = sorted((old, new) for old, new in matched.items()
+                     if old != new)
+
+    changed = []
+    for name in sorted(x for x in matched if matched[x] == x):
+        if remapped[name] != new_nets[name]:
+            changed.append((name,
+                            sorted(new_nets[name] - remapped[name]),
+                            sorted(remapped[name] - new_nets[name])))
+
+    return {'added': sorted(set(new_nets) - claimed),
+            'removed': sorted(set(remapped) - set(matched)),
+            'renamed': renamed, 'changed': changed}
+
+
+def diff_netlists(old_file, new_file):
+    """ Compares two XML netlists. Returns a dict holding the component and
+    net differences. """
+
+    old_root = bom_export.parse_netlist(old_file)
+    new_root = bom_export.parse_netlist(new_file)
+
+    old_components = dict((x['refdes'], x) for x in
+                          bom_export.get_components(old_file, old_root))
+    new_components = dict((x['refdes'], x) for x in
+                          bom_export.get_components(new_file, new_root))
+    old_nets = bom_export.get_nets(old_file, old_root)
+    new_nets = bom_export.get_nets(new_file, new_root)
+
+    matches = match_components(old_components, new_components,
+                               get_pin_nets(old_nets), get_pin_nets(new_nets))
+    renames = dict((old, new) for old, new in matches.items() if old != new)
+
+    return {
+        'added': sorted(set(new_components) - set(matches.values())),
+        'removed': sorted(set(old_components) - set(matches)),
+        'renamed': sorted(renames.items()),
+        'changed': diff_components(old_components, new_components, matches),
+        'nets': diff_nets(old_nets, new_nets, renames),
+    }
+
+
+def format_nodes(nodes):
+    """ Formats a list of (refdes, pin) nodes as 'R1.2, U3.14'. """
+
+    return ", ".join("%s.%s" % x for x in nodes)
+
+
+def format_report(diff):
+    """ Formats a netlist diff as a human-readable ECO report. """
+
+    lines = []
+
+    for refdes in diff['added']:
+        lines.append("Added component: %s" % refdes)
+    for refdes in diff['removed']:
+        lines.append("Removed component: %s" % refdes)
+    for old_ref, new_ref in diff['renamed']:
+        lines.append("Renamed component: %s -> %s" % (old_ref, new_ref))
+
+    for old_ref, new_ref, fields in diff['changed']:
+        name = old_ref
+        if old_ref != new_ref:
+            name = "%s (%s)" % (new_ref, old_ref)
+        for key, old_value, new_value in fields:
+            lines.append("Changed component: %s: %s [%s] -> [%s]" %
+                         (name, key, old_value, new_value))
+
+    nets = diff['nets']
+    for name in nets['added']:
+        lines.append("Added net: %s" % name)
+    for name in nets['removed']:
+        lines.append("Removed net: %s" % name)
+    for old_name, new_name in nets['renamed']:
+        lines.append("Renamed net: %s -> %s" % (old_name, new_name))
+
+    for name, connected, disconnected in nets['changed']:
+        if connected:
+            lines.append("Changed net: %s: connected %s" %
+                         (name, format_nodes(connected)))
+        if disconnected:
+            lines.append("Changed net: %s: disconnected %s" %
+                         (name, format_nodes(disconnected)))
+
+    return lines
+
+
+def main():
+    """ Main ECO report routine. Exits with status 1 if the netlists
+    differ, like diff(1). """
+
+    if len(sys.argv) != 3:
+        sys.stderr.write("Usage: %s OLD_NETLIST NEW_NETLIST\n" %
+                         os.path.basename(sys.argv[0]))
+        sys.exit(2)
+
+    lines = format_report(diff_netlists(sys.argv[1], sys.argv[2]))
+
+    for line in lines:
+        sys.stdout.write(line + "\n")
+
+    if lines:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,396 @@
+#!/usr/bin/env python3
+
+""" Offline part database for costing BOMs. Parts are imported from
+distributor CSV dumps into an SQLite file, indexed by manufacturer part
+number and by value + footprint. Grouped BOM lines (from
+bom_export.group_items) can then be annotated with price breaks, stock and
+lifecycle status in a single bulk join. """
+
+import argparse
+import csv
+import functools
+import os
+import re
+import sqlite3
+import sys
+
+import bom_export
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS parts (
+    mpn TEXT PRIMARY KEY COLLATE NOCASE,
+    manufacturer TEXT NOT NULL DEFAULT '',
+    description TEXT NOT NULL DEFAULT '',
+    value TEXT NOT NULL DEFAULT '',
+    footprint TEXT NOT NULL DEFAULT '',
+    stock INTEGER,
+    lifecycle TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS parts_value_footprint ON parts (value, footprint);
+CREATE TABLE IF NOT EXISTS price_breaks (
+    mpn TEXT NOT NULL COLLATE NOCASE,
+    quantity INTEGER NOT NULL,
+    unit_price REAL NOT NULL,
+    PRIMARY KEY (mpn, quantity)
+) WITHOUT ROWID;
+"""
+
+# Distributor exports name their columns differently. The first alias found
+# in a CSV header is used for each database column.
+CSV_ALIASES = [
+    ['mpn', ['Manufacturer PN', 'Manufacturer Part Number', 'Mfr Part #',
+             'MPN']],
+    ['manufacturer', ['Manufacturer', 'Mfr']],
+    ['description', ['Description']],
+    ['value', ['Value']],
+    ['footprint', ['Footprint', 'Package / Case', 'Package']],
+    ['stock', ['Quantity Available', 'Stock', 'Available']],
+    ['lifecycle', ['Part Status', 'Lifecycle Status', 'Lifecycle']],
+]
+
+PRICE_COLUMN_REGEX = re.compile(r"^price\s*@\s*([0-9,]+)$", flags=re.I)
+
+COST_COLUMNS = bom_export.BOM_COLUMNS + [
+    ['Matched PN', ['matched_pn']],
+    ['Stock', ['stock']],
+    ['Lifecycle', ['lifecycle']],
+    ['Price Breaks', ['price_breaks']],
+    ['Unit Price', ['unit_price']],
+    ['Extended Price', ['extended_price']],
+]
+
+ACTIVE_LIFECYCLES = ["", "active"]
+
+
+def parse_number(text):
+    """ Converts a distributor-formatted number ('$1,234.50', '12 000') to
+    a float. Returns None for blank or non-numeric cells. """
+
+    text = re.sub(r"[^0-9.\-]", "", text or "")
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
+class PartDatabase(object):
+    """ SQLite-backed part database. Single-part lookups (lookup_mpn and
+    lookup_value) go through an in-process LRU cache; whole BOMs are
+    annotated with one bulk join instead. """
+
+    def __init__(self, db_file, cache_size=4096):
+        self.connection = sqlite3.connect(db_file)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.executescript(SCHEMA)
+
+        self.lookup_mpn = functools.lru_cache(cache_size)(self._lookup_mpn)
+        self.lookup_value = functools.lru_cache(cache_size)(
+            self._lookup_value)
+
+    def close(self):
+        """ Closes the underlying database connection. """
+
+        self.connection.close()
+
+    def import_csv(self, csv_file):
+        """ Imports (or updates) parts from a distributor CSV dump. Only the
+        columns present in the dump are updated. Price breaks are read from
+        'Price@<quantity>' columns; if the dump has any, they replace each
+        imported part's existing breaks. Returns the number of parts
+        imported. """
+
+        with open(csv_file, 'r', newline='') as handle:
+            reader = csv.DictReader(handle)
+            headers = reader.fieldnames or []
+
+            columns = []
+            for name, aliases in CSV_ALIASES:
+                found = [x for x in aliases if x in headers]
+                columns.append((name, found[0] if found else None))
+
+            breaks = []
+            for header in headers:
+                match = PRICE_COLUMN_REGEX.match(header.strip())
+                if match is not None:
+                    quantity = int(match.group(1).replace(",", ""))
+                    breaks.append((header, quantity))
+
+            parts = []
+            prices = []
+            for row in reader:
+                record = dict((name, (row.get(header) or "").strip())
+                              for name, header in columns if header)
+                if record.get('mpn', "") == "":
+                    continue
+
+                stock = parse_number(record.get('stock'))
+                record['stock'] = int(stock) if stock is not None else None
+                parts.append(record)
+
+                for header, quantity in breaks:
+                    price = parse_number(row.get(header))
+                    if price is not None:
+                        prices.append((record['mpn'], quantity, price))
+
+        # Only the columns present in this dump are written, so a partial
+        # dump (e.g. a stock update) leaves the other columns alone.
+        names = [name for name, header in columns if header]
+        updates = ", ".join("%s = excluded.%s" % (x, x) for x in names
+                            if x != 'mpn')
+        upsert = "INSERT INTO parts (%s) VALUES (%s) ON CONFLICT (mpn) " % \
+            (", ".join(names), ", ".join("?" * len(names)))
+        upsert += ("DO UPDATE SET " + updates) if updates else "DO NOTHING"
+
+        with self.connection:
+            self.connection.executemany(
+                upsert, [tuple(x[name] for name in names) for x in parts])
+            if breaks:
+                self.connection.executemany(
+                    "DELETE FROM price_breaks WHERE mpn = ?",
+                    [(x['mpn'],) for x in parts])
+                self.connection.executemany(
+                    "INSERT OR REPLACE INTO price_breaks VALUES (?, ?, ?)",
+                    prices)
+
+        self.lookup_mpn.cache_clear()
+        self.lookup_value.cache_clear()
+        return len(parts)
+
+    def _lookup_mpn(self, mpn):
+        """ Returns the part with the given manufacturer PN as a dict
+        (including a 'price_breaks' list of (quantity, price) tuples), or
+        None if it isn't in the database. """
+
+        row = self.connection.execute(
+            "SELECT * FROM parts WHERE mpn = ?", (mpn,)).fetchone()
+        if row is None:
+            return None
+
+        part = dict(row)
+        part['price_breaks'] = [tuple(x) for x in self.connection.execute(
+            "SELECT quantity, unit_price FROM price_breaks WHERE mpn = ? "
+            "ORDER BY quantity", (mpn,))]
+        return part
+
+    def _lookup_value(self, value, footprint):
+        """ Returns the manufacturer PNs of every part with the given value
+        and footprint, as a tuple. """
+
+        return tuple(x[0] for x in self.connection.execute(
+            "SELECT mpn FROM parts WHERE value = ? AND footprint = ? "
+            "ORDER BY mpn", (value, footprint)))
+
+    def annotate(self, line_items, boards=1):
+        """ Annotates grouped BOM lines in place with 'matched_pn', 'stock',
+        'lifecycle', 'price_breaks', 'unit_price' and 'extended_price'.
+        Lines are matched by 'Manufacturer PN', or, when that is blank or
+        not in the database, by a unique value + footprint match. The price
+        break used is the largest one not exceeding the line quantity times
+        'boards'. All lines are resolved with one join against a temporary
+        table. Returns the list of lines. """
+
+        cursor = self.connection.cursor()
+        cursor.execute("CREATE TEMP TABLE IF NOT EXISTS bom (line INTEGER "
+                       "PRIMARY KEY, mpn TEXT COLLATE NOCASE, value TEXT, "
+                       "footprint TEXT, needed INTEGER)")
+        cursor.execute("DELETE FROM bom")
+        cursor.executemany(
+            "INSERT INTO bom VALUES (?, ?, ?, ?, ?)",
+            [(index, line.get('Manufacturer PN', ""), line.get('value', ""),
+              line.get('footprint', ""), int(line['quantity']) * boards)
+             for index, line in enumerate(line_items)])
+
+        query = """
+        WITH matched AS (
+            SELECT bom.line, bom.needed, COALESCE(
+                (SELECT parts.mpn FROM parts WHERE parts.mpn = bom.mpn),
+                (SELECT MIN(parts.mpn) FROM parts
+                 WHERE parts.value = bom.value
+                   AND parts.footprint = bom.footprint
+                 GROUP BY parts.value, parts.footprint
+                 HAVING COUNT(*) = 1)) AS mpn
+            FROM bom
+        )
+        SELECT matched.line, parts.mpn, parts.stock, parts.lifecycle,
+            (SELECT GROUP_CONCAT(quantity || ':' || unit_price, '; ')
+             FROM (SELECT quantity, unit_price FROM price_breaks
+                   WHERE price_breaks.mpn = parts.mpn
+                   ORDER BY quantity)) AS breaks,
+            (SELECT unit_price FROM price_breaks
+             WHERE price_breaks.mpn = parts.mpn
+               AND price_breaks.quantity <= matched.needed
+             ORDER BY quantity DESC LIMIT 1) AS unit_price,
+            matched.needed
+        FROM matched JOIN parts ON parts.mpn = matched.mpn
+        """
+
+        for row in cursor.execute(query):
+            line = line_items[row[0]]
+            line['matched_pn'] = row[1]
+            line['stock'] = "" if row[2] is None else str(row[2])
+            line['lifecycle'] = row[3]
+            line['price_breaks'] = row[4] or ""
+            if row[5] is not None:
+                line['unit_price'] = "%.4f" % row[5]
+                line['extended_price'] = "%.2f" % (row[5] * row[6])
+
+        cursor.execute("DELETE FROM bom")
+        return line_items
+
+
+def summarize(line_items, boards):
+    """ Returns a list of human-readable summary/warning lines for an
+    annotated BOM. """
+
+    total = 0.0
+    messages = []
+
+    for line in line_items:
+        needed = int(line['quantity']) * boards
+
+        if 'matched_pn' not in line:
+            messages.append("Warning: %s not found in part database" %
+                            line['refdes'])
+            continue
+
+        listed_pn = line.get('Manufacturer PN', "")
+        if listed_pn != "" and listed_pn.lower() != line['matched_pn'].lower():
+            messages.append("Warning: %s (%s) not found in part database, "
+                            "matched %s by value and footprint" %
+                            (line['refdes'], listed_pn, line['matched_pn']))
+
+        if 'extended_price' in line:
+            total += float(line['extended_price'])
+        else:
+            messages.append("Warning: %s (%s) has no price break for qty %d" %
+                            (line['refdes'], line['matched_pn'], needed))
+
+        if line['lifecycle'].lower() not in ACTIVE_LIFECYCLES:
+            messages.append("Warning: %s (%s) lifecycle is [%s]" %
+                            (line['refdes'], line['matched_pn'],
+                             line['lifecycle']))
+
+        if line['stock'] != "" and int(line['stock']) < needed:
+            messages.append("Warning: %s (%s) stock %s is below qty %d" %
+                            (line['refdes'], line['matched_pn'],
+                             line['stock'], needed))
+
+    messages.append("Total cost for %d board(s): %.2f" % (boards, total))
+    return messages
+
+
+def make_parser():
+    """ Creates the CLI's argparse instance. """
+
+    description = """Maintains an offline part database and uses it to cost
+    BOMs generated from KiCAD XML netlists. """
+
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('database', metavar="DATABASE",
+                        help="SQLite part database (created if missing).")
+
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    importer = subparsers.add_parser('import', help="Import distributor " +
+                                     "CSV files into the database.")
+    importer.add_argument('csv_files', metavar="CSV_FILE", nargs="+")
+
+    coster = subparsers.add_parser('cost', help="Write a costed BOM for a " +
+                                   "netlist.")
+    coster.add_argument('infile', metavar="NETLIST",
+                        help="KiCAD XML netlist to read.")
+    coster.add_argument('outfile', metavar="OUTFILE",
+                        help="Costed BOM file to write.")
+    coster.add_argument('-n', '--boards', default=1, type=int,
+                        help="Number of boards to cost for (default: 1)")
+    coster.add_argument('-f', '--format', default='tsv',
+                        choices=sorted(bom_export.BOM_WRITERS.keys()),
+                        help="Output format (default: tsv)")
+    coster.add_argument('-q', '--quiet', default=False, action="store_true",
+                        help="Don't echo the BOM to stdout.")
+
+    looker = subparsers.add_parser('lookup', help="Print single parts, by " +
+                                   "manufacturer PN or value + footprint.")
+    looker.add_argument('mpns', metavar="MPN", nargs="*")
+    looker.add_argument('-v', '--value', default='',
+                        help="Also list every part with this value " +
+                        "(requires --footprint).")
+    looker.add_argument('-p', '--footprint', default='',
+                        help="Footprint for --value lookups.")
+
+    return parser
+
+
+def print_part(part):
+    """ Prints one part (as returned by PartDatabase.lookup_mpn) as a
+    tab-separated line. """
+
+    breaks = "; ".join("%d:%g" % x for x in part['price_breaks'])
+    sys.stdout.write("\t".join([part['mpn'], part['manufacturer'],
+                                part['value'], part['footprint'],
+                                "" if part['stock'] is None
+                                else str(part['stock']),
+                                part['lifecycle'], breaks]) + "\n")
+
+
+def lookup_parts(database, mpns, value, footprint):
+    """ Prints the requested parts through the database's cached lookups.
+    Returns the number of lookups that found nothing. """
+
+    missing = 0
+
+    if value != "":
+        matches = database.lookup_value(value, footprint)
+        mpns = list(mpns) + list(matches)
+        if not matches:
+            sys.stderr.write("Error: no part with value [%s] and " % value +
+                             "footprint [%s]\n" % footprint)
+            missing += 1
+
+    for mpn in mpns:
+        part = database.lookup_mpn(mpn)
+        if part is None:
+            sys.stderr.write("Error: [%s] not found in part database\n" %
+                             mpn)
+            missing += 1
+        else:
+            print_part(part)
+
+    return missing
+
+
+def main():
+    """ Main part-database routine. """
+
+    args = make_parser().parse_args()
+    database = PartDatabase(os.path.abspath(os.path.normpath(args.database)))
+
+    try:
+        if args.command == 'import':
+            for csv_file in args.csv_files:
+                count = database.import_csv(csv_file)
+                sys.stderr.write("Imported %d parts from [%s]\n" %
+                                 (count, csv_file))
+            return
+
+        if args.command == 'lookup':
+            if lookup_parts(database, args.mpns, args.value, args.footprint):
+                sys.exit(1)
+            return
+
+        infile = os.path.abspath(os.path.normpath(args.infile))
+        # Lines are annotated by position, so the grouped lines are listed.
+        line_items = list(bom_export.group_items(
+            bom_export.get_components(infile)))
+        database.annotate(line_items, args.boards)
+        bom_export.write_bom(args.outfile, line_items, args.quiet,
+                             args.format, COST_COLUMNS)
+
+        for message in summarize(line_items, args.boards):
+            sys.stderr.write(message + "\n")
+    finally:
+        database.close()
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,7 @@
 in KiCAD (and back-annotation into a schematic). """
 
 import argparse
+import array
 import re
 import os
 import sys
@@ -25,6 +26,101 @@ def sanitize(path):
     return path
 
 
+class ModuleRecords(object):
+    """ Column-oriented store of the component records consumed by this
+    script. Coordinates live in array-backed X/Y columns, board sides in a
+    bytearray, and type prefixes ('R', 'C', 'U', ...) are interned into a
+    small table and referenced by index. Individual records are accessed
+    through lightweight ModuleRecord views. """
+
+    def __init__(self):
+        self.references = []
+        self.x = array.array('d')
+        self.y = array.array('d')
+        self.flipped = bytearray()
+        self.type_names = []
+        self.type_ids = array.array('H')
+        self.modules = []
+        self.new_references = []
+        self._type_index = {}
+
+    def __len__(self):
+        return len(self.references)
+
+    def __getitem__(self, index):
+        return ModuleRecord(self, index)
+
+    def __iter__(self):
+        for index in range(len(self.references)):
+            yield ModuleRecord(self, index)
+
+    def append(self, reference, position, flipped, comp_type, module):
+        """ Adds a record to the end of the store. """
+
+        if comp_type not in self._type_index:
+            self._type_index[comp_type] = len(self.type_names)
+            self.type_names.append(comp_type)
+
+        self.references.append(reference)
+        self.x.append(position[0])
+        self.y.append(position[1])
+        self.flipped.append(1 if flipped else 0)
+        self.type_ids.append(self._type_index[comp_type])
+        self.modules.append(module)
+        self.new_references.append(reference)
+
+    def reorder(self, order):
+        """ Permutes every column by a list of record indexes. """
+
+        self.references = [self.references[x] for x in order]
+        self.x = array.array('d', [self.x[x] for x in order])
+        self.y = array.array('d', [self.y[x] for x in order])
+        self.flipped = bytearray([self.flipped[x] for x in order])
+        self.type_ids = array.array('H', [self.type_ids[x] for x in order])
+        self.modules = [self.modules[x] for x in order]
+        self.new_references = [self.new_references[x] for x in order]
+
+
+class ModuleRecord(object):
+    """ View onto a single row of a ModuleRecords store. """
+
+    __slots__ = ["store", "index"]
+
+    def __init__(self, store, index):
+        self.store = store
+        self.index = index
+
+    @property
+    def reference(self):
+        """ The component's current reference designator. """
+        return self.store.references[self.index]
+
+    @property
+    def position(self):
+        """ The component's (x, y) position. """
+        return (self.store.x[self.index], self.store.y[self.index])
+
+    @property
+    def flipped(self):
+        """ True if the component is on the bottom of the board. """
+        return bool(self.store.flipped[self.index])
+
+    @property
+    def comp_type(self):
+        """ The component's type prefix (e.g. 'R' for 'R12'). """
+        return self.store.type_names[self.store.type_ids[self.index]]
+
+    @property
+    def module(self):
+        """ The underlying pcbnew module. """
+        return self.store.modules[self.index]
+
+    @property
+    def new_reference(self):
+        """ The reference designator the component will be renamed to. """
+        return self.store.new_references[self.index]
+
+
 def get_module_records(board=None):
     """ Locates all of the 'modules' in a loaded Kicad board. These will
     correspond with components in the design. Each module is turned into
@@ -34,7 +130,7 @@ def get_module_records(board=None):
         board = pcbnew.GetBoard()
 
     modules = board.GetModules()
-    records = []
+    records = ModuleRecords()
 
     for module in modules:
         reference = str(module.GetReference().encode("ASCII"))
@@ -43,12 +139,11 @@ def get_module_records(board=None):
             continue
 
         position = module.GetPosition()
-        position = [position[0], position[1]]
         flipped = bool(module.IsFlipped())
         comp_type = re.findall("^[a-zA-Z]+", reference)[0]
 
-        record = [reference, position, flipped, comp_type, module]
-        records.append(record)
+        records.append(reference, (position[0], position[1]), flipped,
+                       comp_type, module)
     return records
 
 
@@ -57,16 +152,16 @@ def scale_records(records):
     with +/-1.0 representing the farthest present co-ordinate in each
     direction. """
 
-    max_number = float('-Inf')
-    for record in records:
-        for coord in record[1]:
-            if abs(coord) > max_number:
-                max_number = float(abs(coord))
+    if len(records) == 0:
+        return records
 
-    # pylint: disable=invalid-name, consider-using-enumerate
-    for x in range(len(records)):
-        records[x][1] = [float(k) / max_number for k in records[x][1]]
+    max_number = float(max(max(abs(x) for x in records.x),
+                           max(abs(y) for y in records.y)))
+    if max_number == 0:
+        return records
 
+    records.x = array.array('d', [x / max_number for x in records.x])
+    records.y = array.array('d', [y / max_number for y in records.y])
     return records
 
 
@@ -78,33 +173,32 @@ def sort_records(records, mult=100):
 
     The X and Y co-ordinates are first quantized by a 'mult' factor. """
 
-    def key(record):
-        """ Sorting function for component records """
-        comp_type = record[2]
-        comp_side = record[3]
-        x_index = 8 * round(mult * record[1][0]) + round(mult * record[1][1])
-        y_index = round(mult * record[1][1])
-        return (comp_type, comp_side, x_index, y_index)
+    x_quantized = [round(mult * x) for x in records.x]
+    y_quantized = [round(mult * y) for y in records.y]
+    type_names = [records.type_names[x] for x in records.type_ids]
 
-    records = sorted(records, key=key)
+    keys = [(type_names[x], records.flipped[x],
+             8 * x_quantized[x] + y_quantized[x], y_quantized[x])
+            for x in range(len(records))]
+
+    records.reorder(sorted(range(len(records)), key=keys.__getitem__))
     return records
 
 
 def calculate_remaps(records):
-    """ Adds a record entry to each record indicating its new remapped value.
-    The record list should already have been sorted prior to using this
+    """ Fills in each record's new (remapped) reference designator. The
+    records should already have been sorted prior to using this
     function. """
 
-    comp_type = ""
-    index = 0
+    counts = [0] * len(records.type_names)
+    new_references = []
+
+    for type_id in records.type_ids:
+        counts[type_id] = counts[type_id] + 1
+        new_references.append(records.type_names[type_id] +
+                              str(counts[type_id]))
 
-    # pylint: disable=invalid-name, consider-using-enumerate
-    for x in range(len(records)):
-        if records[x][3] != comp_type:
-            comp_type = records[x][3]
-            index = 0
-        index = index + 1
-        records[x].append(comp_type + str(index))
+    records.new_references = new_references
     return records
 
 
@@ -116,17 +210,18 @@ def remap_pcb(board, pcb_file, records, dry_run=False, quiet=False):
     net_renames = 0
 
     for record in records:
-        if record[0] == record[5]:
+        if record.reference == record.new_reference:
             continue
 
         comp_renames = comp_renames + 1
 
         if not quiet:
-            sys.stdout.write("Renaming %s to %s\n" % (record[0], record[5]))
+            sys.stdout.write("Renaming %s to %s\n" % (record.reference,
+                                                      record.new_reference))
 
         if not dry_run:
-            record[4].SetReference(record[5])
-            record[4].SetSelected()
+            record.module.SetReference(record.new_reference)
+            record.module.SetSelected()
 
     if not dry_run:
         board.SetModified()
@@ -135,12 +230,12 @@ def remap_pcb(board, pcb_file, records, dry_run=False, quiet=False):
     data = open(pcb_file, 'r').read()
 
     for record in records:
-        if record[0] == record[5]:
+        if record.reference == record.new_reference:
             continue
 
         net_renames = net_renames + 1
-        old_refdes = record[0]
-        new_refdes = record[5]
+        old_refdes = record.reference
+        new_refdes = record.new_reference
 
         regex = "Net-[(]%s-.*?[)]" % old_refdes
 
@@ -182,8 +277,8 @@ def remap_schematic(schematic_file, records, dry_run=False, quiet=False):
     schematic_data = open(schematic_file, 'r').read()
 
     for record in records:
-        old_refdes = record[0]
-        new_refdes = record[5]
+        old_refdes = record.reference
+        new_refdes = record.new_reference
 
         if old_refdes == new_refdes:
             continue
@@ -237,15 +332,15 @@ def print_records(records):
     """ Prints a human-readable list of all located components. """
 
     for record in records:
-        refdes = record[0]
-        location = record[1]
+        refdes = record.reference
+        location = record.position
 
-        if record[2]:
+        if record.flipped:
             side = "bottom"
         else:
             side = "top"
 
-        comp_type = record[3]
+        comp_type = record.comp_type
 
         sys.stdout.write("Found component [%s] of type [%s]. Side: [%s]. " %
                          (refdes, comp_type, side))
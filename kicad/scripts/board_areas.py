@@ -0,0 +1,387 @@
+#!/usr/bin/env python3
+
+""" Standalone command-line script for computing copper, soldermask and
+solder-paste areas on each layer of a KiCAD PCB, with optional
+per-footprint breakdowns. Reads the .kicad_pcb file directly (no pcbnew
+required) and does all of the geometry with batched NumPy operations. """
+
+import argparse
+import os
+import sys
+
+import numpy as np
+
+import kicad_pcb
+import pcb_scan
+
+__version__ = "1.0"
+
+PAD_SHAPES = ["rect", "circle", "oval", "roundrect", "trapezoid"]
+SHAPE_INDEX = dict((x, n) for n, x in enumerate(PAD_SHAPES))
+
+
+def sanitize(path):
+    """ Runs a number of path transformations to clean up and normalize
+    an user-supplied path. """
+
+    path = os.path.expanduser(path)
+    path = os.path.expandvars(path)
+    path = os.path.normcase(path)
+    path = os.path.normpath(path)
+    path = os.path.abspath(path)
+    return path
+
+
+def shape_areas(shapes, widths, heights, ratios):
+    """ Computes the area of a batch of pad shapes. 'shapes' holds indexes
+    into PAD_SHAPES; unknown shapes are treated as their bounding box. """
+
+    widths = np.maximum(widths, 0.0)
+    heights = np.maximum(heights, 0.0)
+    short_side = np.minimum(widths, heights)
+    box = widths * heights
+
+    corner_radius = np.where(shapes == PAD_SHAPES.index("oval"),
+                             short_side / 2, ratios * short_side)
+    rounded = box - (4 - np.pi) * corner_radius ** 2
+    circle = np.pi * (widths / 2) ** 2
+
+    return np.select([shapes == PAD_SHAPES.index("circle"),
+                      shapes == PAD_SHAPES.index("oval"),
+                      shapes == PAD_SHAPES.index("roundrect")],
+                     [circle, rounded, rounded], box)
+
+
+def polygon_areas(polygons):
+    """ Computes the areas of a list of polygons with a single batched
+    shoelace pass. Returns an array with one area per polygon. """
+
+    counts = np.array([len(x) for x in polygons], dtype=np.intp)
+    if counts.sum() == 0:
+        return np.zeros(len(polygons))
+
+    points = np.concatenate([np.asarray(x, dtype=float).reshape(-1, 2)
+                             for x in polygons])
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+
+    # Each vertex's successor, wrapping around within its own polygon.
+    successor = np.arange(len(points)) + 1
+    successor[starts + counts - 1] = starts
+
+    cross = (points[:, 0] * points[successor, 1] -
+             points[successor, 0] * points[:, 1])
+
+    areas = np.zeros(len(polygons))
+    nonempty = counts > 0
+    areas[nonempty] = np.add.reduceat(cross, starts[nonempty])
+    return np.abs(areas) / 2
+
+
+class PadTable(object):
+    """ Column-oriented view of every pad on the board. 'layers' is a
+    boolean (pads x board-layers) membership matrix. """
+
+    def __init__(self, data, pads):
+        self.board_layers = pcb_scan.scan_layers(data)
+        self.modules = pads['modules']
+
+        defaults = np.array([
+            pcb_scan.scan_setup_value(data, "pad_to_mask_clearance", 0.0),
+            pcb_scan.scan_setup_value(data, "pad_to_paste_clearance", 0.0),
+            pcb_scan.scan_setup_value(data, "pad_to_paste_clearance_ratio",
+                                      0.0)])
+
+        # Layer wildcards are only expanded once per distinct layer list.
+        layer_index = dict((x, n) for n, x in enumerate(self.board_layers))
+        pattern_layers = np.zeros((len(pads['layer_lists']),
+                                   len(self.board_layers)), dtype=bool)
+        for pattern, layers in enumerate(pads['layer_lists']):
+            columns = [layer_index[x] for x in
+                       kicad_pcb.expand_layers(layers, self.board_layers)]
+            pattern_layers[pattern, columns] = True
+
+        # Layer lists that expand to the same layers share one pattern.
+        pattern_layers, canonical = np.unique(pattern_layers, axis=0,
+                                              return_inverse=True)
+
+        shape_index = np.array([SHAPE_INDEX.get(x, -1)
+                                for x in pads['shape_names']], dtype=np.intp)
+
+        data = np.column_stack((
+            pads['module'], shape_index[pads['shape']], pads['x'],
+            pads['y'], pads['rotation'] % 180, pads['width'],
+            pads['height'], pads['roundrect_ratio'],
+            canonical.ravel()[pads['layers']]))
+
+        # Identical pads stacked on top of each other within a footprint
+        # (same geometry, same layers) only contribute their area once.
+        # Adding zero turns any -0.0 left by the rounding into 0.0.
+        signature = np.round(data, 6) + 0.0
+        keep = np.sort(np.unique(signature, axis=0, return_index=True)[1])
+        data = data[keep]
+
+        module_margins = np.column_stack((
+            self.modules['solder_mask_margin'],
+            self.modules['solder_paste_margin'],
+            self.modules['solder_paste_ratio']))
+        pad_margins = np.column_stack((pads['solder_mask_margin'][keep],
+                                       pads['solder_paste_margin'][keep],
+                                       pads['solder_paste_ratio'][keep]))
+
+        self.module = data[:, 0].astype(np.intp)
+        self.layers = pattern_layers[data[:, 8].astype(np.intp)]
+        margins = _pick(pad_margins, module_margins[self.module], defaults)
+
+        self.shape = data[:, 1].astype(np.intp)
+        self.width = data[:, 5]
+        self.height = data[:, 6]
+        self.ratio = data[:, 7]
+        self.mask_margin = margins[:, 0]
+        self.paste_margin = margins[:, 1]
+        self.paste_ratio = margins[:, 2]
+
+    def copper_areas(self):
+        """ Returns the copper area of each pad. """
+
+        return shape_areas(self.shape, self.width, self.height, self.ratio)
+
+    def mask_areas(self):
+        """ Returns the soldermask opening area of each pad. """
+
+        return shape_areas(self.shape, self.width + 2 * self.mask_margin,
+                           self.height + 2 * self.mask_margin, self.ratio)
+
+    def paste_areas(self):
+        """ Returns the solder-paste aperture area of each pad. """
+
+        width = self.width + 2 * (self.paste_margin +
+                                  self.paste_ratio * self.width)
+        height = self.height + 2 * (self.paste_margin +
+                                    self.paste_ratio * self.height)
+        return shape_areas(self.shape, width, height, self.ratio)
+
+    def column(self, layer):
+        """ Returns the membership column for a layer name (all False if the
+        board doesn't define that layer). """
+
+        if layer not in self.board_layers:
+            return np.zeros(len(self.shape), dtype=bool)
+        return self.layers[:, self.board_layers.index(layer)]
+
+
+def _pick(pad_values, module_values, defaults):
+    """ Resolves pad margins column-wise: the pad's own value, else its
+    module's, else the board default. Missing values are NaN. KiCAD treats
+    a local margin of zero as 'inherit', so zeros are skipped as well
+    (except for the board default). """
+
+    def is_set(values):
+        """ True where a local value overrides the next fallback. """
+        return ~np.isnan(values) & (values != 0)
+
+    return np.where(is_set(pad_values), pad_values,
+                    np.where(is_set(module_values), module_values, defaults))
+
+
+def track_areas(segments, vias, copper_layers):
+    """ Returns a dict mapping each copper layer to the area covered by
+    track segments and via pads (as returned by pcb_scan.segment_columns and
+    pcb_scan.via_columns). Overlaps between tracks are not subtracted. """
+
+    lengths = np.hypot(segments['x2'] - segments['x1'],
+                       segments['y2'] - segments['y1'])
+    widths = segments['width']
+    areas = lengths * widths + np.pi * (widths / 2) ** 2
+    totals = np.bincount(segments['layer'], weights=areas,
+                         minlength=len(segments['layer_names']))
+    result = dict(zip(segments['layer_names'], totals))
+
+    if len(vias['size']):
+        # Map each via's end layers to their position in the stack.
+        stack = np.array([copper_layers.index(x)
+                          for x in vias['layer_names']], dtype=np.intp)
+        start = stack[vias['start']]
+        end = stack[vias['end']]
+        areas = np.pi * (vias['size'] / 2) ** 2
+        for layer_index, layer in enumerate(copper_layers):
+            inside = (np.minimum(start, end) <= layer_index) & \
+                (np.maximum(start, end) >= layer_index)
+            result[layer] = result.get(layer, 0.0) + areas[inside].sum()
+
+    return result
+
+
+def zone_areas(zones):
+    """ Returns a dict mapping each layer to the area of its filled copper
+    zones (as returned by pcb_scan.zone_columns). """
+
+    result = {}
+    polygons = []
+    layers = []
+
+    for zone in zones:
+        polygons += zone['polygons']
+        layers += [zone['layer']] * len(zone['polygons'])
+
+    if not polygons:
+        return result
+
+    areas = polygon_areas(polygons)
+    for layer, area in zip(layers, areas):
+        result[layer] = result.get(layer, 0.0) + area
+
+    return result
+
+
+def layer_report(pads, tracks, zones):
+    """ Builds the per-layer area summary from a PadTable and the per-layer
+    track and zone areas. Returns a list of dicts, one per board side. """
+
+    copper = pads.copper_areas()
+    mask = pads.mask_areas()
+    paste = pads.paste_areas()
+    report = []
+
+    for side in ["F", "B"]:
+        on_copper = pads.column(side + ".Cu")
+        on_mask = pads.column(side + ".Mask")
+        on_paste = pads.column(side + ".Paste")
+
+        pad_copper = copper[on_copper].sum()
+        pasted_copper = copper[on_copper & on_paste].sum()
+        paste_area = paste[on_paste].sum()
+
+        report.append({
+            'side': side,
+            'pad_copper': pad_copper,
+            'copper': pad_copper + tracks.get(side + ".Cu", 0.0) +
+                      zones.get(side + ".Cu", 0.0),
+            'exposed_copper': copper[on_copper & on_mask].sum(),
+            'mask_openings': mask[on_mask].sum(),
+            'paste': paste_area,
+            'paste_ratio': paste_area / pasted_copper
+                           if pasted_copper > 0 else float('nan'),
+        })
+
+    return report
+
+
+def footprint_report(pads):
+    """ Builds the per-footprint area breakdown. Returns a list of dicts,
+    one per module, ordered as they appear in the board file. """
+
+    copper = pads.copper_areas()
+    paste = pads.paste_areas()
+    count = len(pads.modules['name'])
+    columns = {}
+
+    for side in ["F", "B"]:
+        on_copper = pads.column(side + ".Cu")
+        on_mask = pads.column(side + ".Mask")
+        on_paste = pads.column(side + ".Paste")
+
+        columns[side + "_copper"] = np.bincount(
+            pads.module, weights=copper * on_copper, minlength=count)
+        columns[side + "_exposed"] = np.bincount(
+            pads.module, weights=copper * (on_copper & on_mask),
+            minlength=count)
+        columns[side + "_pasted"] = np.bincount(
+            pads.module, weights=copper * (on_copper & on_paste),
+            minlength=count)
+        columns[side + "_paste"] = np.bincount(
+            pads.module, weights=paste * on_paste, minlength=count)
+
+    report = []
+    for index in range(count):
+        pasted = columns["F_pasted"][index] + columns["B_pasted"][index]
+        paste_area = columns["F_paste"][index] + columns["B_paste"][index]
+        report.append({
+            'reference': pads.modules['reference'][index],
+            'footprint': pads.modules['footprint'][index],
+            'copper': columns["F_copper"][index] + columns["B_copper"][index],
+            'exposed_copper': columns["F_exposed"][index] +
+                              columns["B_exposed"][index],
+            'paste': paste_area,
+            'paste_ratio': paste_area / pasted if pasted > 0
+                           else float('nan'),
+        })
+
+    return report
+
+
+def print_reports(layers, footprints=None):
+    """ Prints human-readable area tables (all areas in mm^2). """
+
+    sys.stdout.write("%-6s %12s %12s %12s %12s %12s %8s\n" %
+                     ("Side", "Copper", "Pad copper", "Exposed Cu",
+                      "Mask open", "Paste", "Paste/Cu"))
+    for layer in layers:
+        sys.stdout.write("%-6s %12.3f %12.3f %12.3f %12.3f %12.3f %8.3f\n" %
+                         (layer['side'], layer['copper'], layer['pad_copper'],
+                          layer['exposed_copper'], layer['mask_openings'],
+                          layer['paste'], layer['paste_ratio']))
+
+    if footprints is None:
+        return
+
+    sys.stdout.write("\n%-10s %-28s %10s %10s %10s %8s\n" %
+                     ("Refdes", "Footprint", "Copper", "Exposed Cu",
+                      "Paste", "Paste/Cu"))
+    for line in footprints:
+        sys.stdout.write("%-10s %-28s %10.3f %10.3f %10.3f %8.3f\n" %
+                         (line['reference'], line['footprint'],
+                          line['copper'], line['exposed_copper'],
+                          line['paste'], line['paste_ratio']))
+
+
+def make_parser():
+    """ Creates the CLI's argparse instance. """
+
+    description = """Script for reporting copper, exposed-copper, soldermask
+    and solder-paste areas for each side of a KiCAD PCB. Useful for plating
+    cost estimates and stencil review. All areas are in mm^2. Overlapping
+    features are summed rather than merged, except for identical pads
+    stacked within one footprint, which are counted once. """
+
+    parser = argparse.ArgumentParser(description=description)
+
+    parser.add_argument('pcb_file', metavar="PCB_FILE",
+                        help="Target .kicad_pcb file to analyze.")
+
+    parser.add_argument('-f', '--footprints', default=False,
+                        action="store_true",
+                        help="Also print a per-footprint breakdown.")
+
+    version_string = "%(prog)s" + " v%s" % __version__
+    parser.add_argument('--version', action='version', version=version_string)
+
+    parser.epilog = """Copyright 2017, Nicholas Clark."""
+    return parser
+
+
+def main():
+    """ Main function for this script. """
+
+    parser = make_parser()
+    args = parser.parse_args()
+    args.pcb_file = sanitize(args.pcb_file)
+
+    if not os.access(args.pcb_file, os.R_OK):
+        sys.stderr.write("Error: can't open file [%s]\n" % args.pcb_file)
+        sys.exit(1)
+
+    data = pcb_scan.read_board_data(args.pcb_file)
+    board = pcb_scan.scan_board(data, "pad", "segment", "via", "zone")
+    pads = PadTable(data, board['pad'])
+    tracks = track_areas(board['segment'], board['via'],
+                         pcb_scan.scan_copper_layers(data))
+    zones = zone_areas(board['zone'])
+    footprints = None
+
+    if args.footprints:
+        footprints = footprint_report(pads)
+
+    print_reports(layer_report(pads, tracks, zones), footprints)
+
+if __name__ == "__main__":
+    main()
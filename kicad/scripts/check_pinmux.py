@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+
+""" Standalone command-line script for cross-checking MCU pin assignments.
+Joins a pin-function table (one line per pin, functions separated by '/'),
+the part's footprint, and the nets on a KiCAD PCB, and reports any net whose
+name doesn't correspond to a function that its pin can actually provide. """
+
+import argparse
+import os
+import re
+import sys
+
+import kicad_pcb
+
+__version__ = "1.0"
+
+
+def sanitize(path):
+    """ Runs a number of path transformations to clean up and normalize
+    an user-supplied path. """
+
+    path = os.path.expanduser(path)
+    path = os.path.expandvars(path)
+    path = os.path.normcase(path)
+    path = os.path.normpath(path)
+    path = os.path.abspath(path)
+    return path
+
+
+def read_pin_table(pin_table_file):
+    """ Reads a pin-function table. Line N of the file describes pin N.
+    Returns a dict mapping each pin number (as a string, to match KiCAD pad
+    numbers) to the list of functions that pin supports. """
+
+    pins = {}
+
+    with open(pin_table_file, 'r') as handle:
+        for number, line in enumerate(handle):
+            line = re.sub("[#].*", "", line).strip()
+            if line != "":
+                pins[str(number + 1)] = [x.strip().upper()
+                                         for x in line.split("/")]
+
+    return pins
+
+
+def read_footprint_pads(footprint_file):
+    """ Returns the set of pad numbers defined by a .kicad_mod footprint. """
+
+    with open(footprint_file, 'r') as handle:
+        footprint = kicad_pcb.parse_sexpr(handle.read())
+
+    return set(x[1] for x in kicad_pcb.children(footprint, "pad"))
+
+
+def net_tokens(net_name):
+    """ Returns every run of consecutive '_'-separated words in a net name,
+    after stripping its hierarchical sheet path. 'UART0_RX_DBG' produces
+    'UART0', 'UART0_RX', 'UART0_RX_DBG', 'RX', ... . These are the keys that
+    are looked up in the function indexes. """
+
+    name = net_name.split("/")[-1].upper()
+    words = [x for x in re.split("[^A-Z0-9]+", name) if x != ""]
+    name = "_".join(words)
+
+    tokens = set([name])
+    for start in range(len(words)):
+        for end in range(start + 1, len(words) + 1):
+            tokens.add("_".join(words[start:end]))
+    return tokens
+
+
+def build_indexes(board, footprints):
+    """ Builds the pad -> net and net -> refdes indexes for a board in a
+    single pass over its modules. Returns a (pad_nets, net_refs) tuple.
+    'pad_nets' maps each requested footprint name to a dict of
+    (refdes, pad) -> net name for every instance of that footprint;
+    'net_refs' maps net name -> the set of all reference designators
+    attached to that net. """
+
+    pad_nets = dict((x, {}) for x in footprints)
+    net_refs = {}
+
+    for module in kicad_pcb.get_modules(board):
+        part_nets = pad_nets.get(module['footprint'])
+        for pad in module['pads']:
+            if pad['net_name'] == "":
+                continue
+            net_refs.setdefault(pad['net_name'], set()).add(
+                module['reference'])
+            if part_nets is not None:
+                part_nets[(module['reference'], pad['number'])] = \
+                    pad['net_name']
+
+    return pad_nets, net_refs
+
+
+def check_part(pins, pad_nets, net_refs, strict=False):
+    """ Joins a part's pin-function index against its pad -> net index.
+    Returns a list of error strings, one per mismatched pin.
+
+    Unless 'strict' is set, only nets whose names claim some function of the
+    part (e.g. '/UART0_TX') are checked; generic names such as 'HEADER_A[1]'
+    and KiCAD's auto-generated 'Net-(...)' names are ignored. """
+
+    all_functions = set()
+    for functions in pins.values():
+        all_functions.update(functions)
+
+    allowed_index = dict((x, set(y)) for x, y in pins.items())
+    errors = []
+
+    for (refdes, pad), net in sorted(pad_nets.items()):
+        if net.startswith("Net-("):
+            continue
+
+        if pad not in allowed_index:
+            errors.append("%s pad %s (net %s): pad not in pin table" %
+                          (refdes, pad, net))
+            continue
+
+        tokens = net_tokens(net)
+        if tokens & allowed_index[pad]:
+            continue
+        if not strict and not tokens & all_functions:
+            continue
+
+        others = sorted(net_refs.get(net, set()) - set([refdes]))
+        errors.append("%s pin %s [%s] is on net %s, which isn't one of its "
+                      "functions (net also reaches: %s)" %
+                      (refdes, pad, "/".join(pins[pad]), net,
+                       ", ".join(others) or "nothing"))
+
+    return errors
+
+
+def check_footprint(pins, footprint_file):
+    """ Compares a pin table against the pads of a footprint file. Returns
+    a list of error strings. """
+
+    pads = read_footprint_pads(footprint_file)
+    errors = []
+
+    for pin in sorted(set(pins) - pads, key=int):
+        errors.append("Pin %s is in the pin table but not on footprint %s" %
+                      (pin, os.path.basename(footprint_file)))
+    for pad in sorted(pads - set(pins)):
+        errors.append("Pad %s is on footprint %s but not in the pin table" %
+                      (pad, os.path.basename(footprint_file)))
+
+    return errors
+
+
+def make_parser():
+    """ Creates the CLI's argparse instance. """
+
+    description = """Script for cross-checking MCU pin assignments on a KiCAD
+    PCB against a table of each pin's allowed functions. Pass one -p/-f pair
+    per MCU type; every instance of each footprint on the board is checked.
+    """
+
+    parser = argparse.ArgumentParser(description=description)
+
+    parser.add_argument('pcb_file', metavar="PCB_FILE",
+                        help="Target .kicad_pcb file to check.")
+
+    parser.add_argument('-p', '--pin_table', action="append", required=True,
+                        help="Pin-function table (line N describes pin N).")
+
+    parser.add_argument('-f', '--footprint', action="append", required=True,
+                        help="Footprint name the matching pin table " +
+                        "applies to (e.g. QFP_64).")
+
+    parser.add_argument('-l', '--library', default='',
+                        help="Footprint library directory. If given, each " +
+                        "footprint's pads are also checked against its " +
+                        "pin table.")
+
+    parser.add_argument('-s', '--strict', default=False, action="store_true",
+                        help="Check every named net on the MCU, not just " +
+                        "nets named after a pin function.")
+
+    version_string = "%(prog)s" + " v%s" % __version__
+    parser.add_argument('--version', action='version', version=version_string)
+
+    parser.epilog = """Copyright 2017, Nicholas Clark."""
+    return parser
+
+
+def main():
+    """ Main function for this script. """
+
+    parser = make_parser()
+    args = parser.parse_args()
+    args.pcb_file = sanitize(args.pcb_file)
+
+    if len(args.pin_table) != len(args.footprint):
+        sys.stderr.write("Error: each pin table needs a matching " +
+                         "footprint.\n")
+        sys.exit(1)
+
+    args.pin_table = [sanitize(x) for x in args.pin_table]
+    inputs = [args.pcb_file] + args.pin_table
+
+    if args.library != "":
+        inputs += [os.path.join(sanitize(args.library), x + ".kicad_mod")
+                   for x in args.footprint]
+
+    for path in inputs:
+        if not os.access(path, os.R_OK):
+            sys.stderr.write("Error: can't open file [%s]\n" % path)
+            sys.exit(1)
+
+    board = kicad_pcb.load_board(args.pcb_file)
+    pad_nets, net_refs = build_indexes(board, args.footprint)
+    errors = []
+
+    for pin_table, footprint in zip(args.pin_table, args.footprint):
+        pins = read_pin_table(pin_table)
+
+        if args.library != "":
+            footprint_file = os.path.join(sanitize(args.library),
+                                          footprint + ".kicad_mod")
+            errors += check_footprint(pins, footprint_file)
+
+        if not pad_nets[footprint]:
+            sys.stderr.write("Warning: no instances of footprint [%s] on " %
+                             footprint + "the board.\n")
+        errors += check_part(pins, pad_nets[footprint], net_refs,
+                             args.strict)
+
+    for error in errors:
+        sys.stderr.write("Error: %s\n" % error)
+
+    if errors:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
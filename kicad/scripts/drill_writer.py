@@ -0,0 +1,298 @@
+""" Pure-Python drill backend for generate_drills.py. Collects pad and via
+holes from a parsed .kicad_pcb file, bins them into a tool table, orders
+each tool's holes to reduce machine travel, and writes Excellon files and a
+drill report without needing pcbnew. """
+
+import math
+import time
+
+import kicad_pcb
+
+DEFAULT_BIN_TOLERANCE = 0.001
+
+
+class Hole(object):
+    """ A single drilled hole or slot, in board coordinates (mm). Round
+    holes have identical start and end points. """
+
+    __slots__ = ["start", "end", "diameter", "plated"]
+
+    def __init__(self, start, end, diameter, plated):
+        self.start = start
+        self.end = end
+        self.diameter = diameter
+        self.plated = plated
+
+    @property
+    def is_slot(self):
+        """ True if this hole is an oval slot rather than a round hole. """
+        return self.start != self.end
+
+
+class Tool(object):
+    """ One entry in a drill file's tool table, with its ordered holes. """
+
+    __slots__ = ["number", "diameter", "holes"]
+
+    def __init__(self, number, diameter, holes):
+        self.number = number
+        self.diameter = diameter
+        self.holes = holes
+
+    @property
+    def slot_count(self):
+        """ Number of slots drilled with this tool. """
+        return len([x for x in self.holes if x.is_slot])
+
+
+def collect_holes(board):
+    """ Returns a list of Hole objects for every drilled pad and via on a
+    parsed board. """
+
+    holes = []
+
+    for module in kicad_pcb.get_modules(board):
+        for pad in module['pads']:
+            if pad['drill'] is None or min(pad['drill']) <= 0:
+                continue
+
+            width, height = pad['drill']
+            center = (pad['x'] + pad['drill_offset'][0],
+                      pad['y'] + pad['drill_offset'][1])
+            half = abs(width - height) / 2.0
+
+            if width > height:
+                delta = kicad_pcb.rotate(half, 0.0, pad['rotation'])
+            else:
+                delta = kicad_pcb.rotate(0.0, half, pad['rotation'])
+
+            start = (center[0] - delta[0], center[1] - delta[1])
+            end = (center[0] + delta[0], center[1] + delta[1])
+            holes.append(Hole(start, end, min(width, height),
+                              pad['type'] != "np_thru_hole"))
+
+    for via in kicad_pcb.get_vias(board):
+        position = (via[0], via[1])
+        holes.append(Hole(position, position, via[3], True))
+
+    return holes
+
+
+def bin_diameters(holes, tolerance=DEFAULT_BIN_TOLERANCE):
+    """ Groups holes whose diameters lie within 'tolerance' (mm) of the
+    smallest diameter in their group. Returns a list of (diameter, holes)
+    pairs, smallest first; each group is drilled with its largest
+    diameter. """
+
+    groups = []
+
+    for hole in sorted(holes, key=lambda x: x.diameter):
+        if groups and hole.diameter - groups[-1][0] <= tolerance:
+            groups[-1][1].append(hole)
+        else:
+            groups.append((hole.diameter, [hole]))
+
+    return [(max(x.diameter for x in group), group) for _, group in groups]
+
+
+class HoleTree(object):
+    """ Static 2-d tree over hole start points that supports removing
+    holes and nearest-neighbor queries over the holes that remain. Each
+    subtree keeps a count of its remaining holes so that exhausted regions
+    are skipped entirely. """
+
+    def __init__(self, holes):
+        self.holes = list(holes)
+        self.remaining = [1] * len(self.holes)
+        self.counts = [0] * len(self.holes)
+        self.position = [0] * len(self.holes)
+
+        stack = [(0, len(self.holes), 0)]
+        while stack:
+            low, high, axis = stack.pop()
+            if low >= high:
+                continue
+            self.holes[low:high] = sorted(self.holes[low:high],
+                                          key=lambda x: x.start[axis])
+            middle = (low + high) // 2
+            self.counts[middle] = high - low
+            stack.append((low, middle, 1 - axis))
+            stack.append((middle + 1, high, 1 - axis))
+
+        for index, hole in enumerate(self.holes):
+            self.position[index] = hole.start
+
+    def remove(self, index):
+        """ Removes the hole stored at 'index' (as returned by nearest). """
+
+        low, high = 0, len(self.holes)
+        while low < high:
+            middle = (low + high) // 2
+            self.counts[middle] -= 1
+            if index == middle:
+                break
+            elif index < middle:
+                high = middle
+            else:
+                low = middle + 1
+
+        self.remaining[index] = 0
+
+    def nearest(self, point):
+        """ Returns the index of the remaining hole closest to 'point', or
+        None if no holes remain. """
+
+        best = None
+        best_distance = float('Inf')
+        stack = [(0, len(self.holes), 0, 0.0)]
+
+        while stack:
+            low, high, axis, plane_distance = stack.pop()
+            if low >= high or plane_distance >= best_distance:
+                continue
+
+            middle = (low + high) // 2
+            if self.counts[middle] == 0:
+                continue
+
+            position = self.position[middle]
+            if self.remaining[middle]:
+                distance = math.hypot(position[0] - point[0],
+                                      position[1] - point[1])
+                if distance < best_distance:
+                    best, best_distance = middle, distance
+
+            # Search the side containing the point first; the far side only
+            # needs visiting if the splitting line is closer than the best.
+            offset = point[axis] - position[axis]
+            if offset < 0:
+                if -offset < best_distance:
+                    stack.append((middle + 1, high, 1 - axis, -offset))
+                stack.append((low, middle, 1 - axis, 0.0))
+            else:
+                if offset < best_distance:
+                    stack.append((low, middle, 1 - axis, offset))
+                stack.append((middle + 1, high, 1 - axis, 0.0))
+
+        return best
+
+
+def order_path(holes, start=(0.0, 0.0)):
+    """ Orders holes with a greedy nearest-neighbor walk starting from
+    'start', to cut down on machine travel. A 2-d tree keeps each
+    nearest-neighbor search logarithmic. Returns the reordered list. """
+
+    if len(holes) < 3:
+        return list(holes)
+
+    tree = HoleTree(holes)
+    ordered = []
+    current = start
+
+    for _ in range(len(holes)):
+        index = tree.nearest(current)
+        tree.remove(index)
+        ordered.append(tree.holes[index])
+        current = tree.holes[index].end
+
+    return ordered
+
+
+def make_tools(holes, tolerance=DEFAULT_BIN_TOLERANCE):
+    """ Builds a numbered tool table from a list of holes. Each tool's holes
+    are path-ordered, continuing from where the previous tool finished.
+    Returns a list of Tool objects. """
+
+    tools = []
+    position = (0.0, 0.0)
+
+    for number, (diameter, group) in enumerate(bin_diameters(holes,
+                                                             tolerance)):
+        ordered = order_path(group, position)
+        tools.append(Tool(number + 1, diameter, ordered))
+        position = ordered[-1].end
+
+    return tools
+
+
+def write_excellon(handle, tools, origin, metric=False, title=""):
+    """ Writes an Excellon drill file (decimal format, absolute
+    coordinates) to an open handle. Coordinates are relative to 'origin',
+    with Y pointing up. Slots are written as G85 canned slots. """
+
+    scale = 1.0 if metric else 1.0 / 25.4
+    digits = 3 if metric else 4
+
+    def coords(point):
+        """ Formats a board point as Excellon X/Y words. """
+        return "X%.*fY%.*f" % (digits, (point[0] - origin[0]) * scale,
+                               digits, (origin[1] - point[1]) * scale)
+
+    handle.write("M48\n")
+    handle.write(";DRILL file {%s} date %s\n" %
+                 (title, time.strftime("%Y-%m-%d %H:%M:%S")))
+    handle.write(";FORMAT={-:-/ absolute / %s / decimal}\n" %
+                 ("metric" if metric else "inch"))
+    handle.write("FMAT,2\n")
+    handle.write("%s,TZ\n" % ("METRIC" if metric else "INCH"))
+
+    for tool in tools:
+        handle.write("T%dC%.*f\n" % (tool.number, digits,
+                                     tool.diameter * scale))
+
+    handle.write("%\nG90\nG05\n")
+    handle.write("%s\n" % ("M71" if metric else "M72"))
+
+    for tool in tools:
+        handle.write("T%d\n" % tool.number)
+        for hole in tool.holes:
+            if hole.is_slot:
+                handle.write("%sG85%s\n" % (coords(hole.start),
+                                             coords(hole.end)))
+            else:
+                handle.write("%s\n" % coords(hole.start))
+
+    handle.write("T0\nM30\n")
+
+
+def make_report(plated_tools, unplated_tools):
+    """ Builds a structured drill report. Returns a dict with 'plated' and
+    'unplated' lists of per-tool dicts holding the tool number, diameter
+    (mm and inch), hole count and slot count. """
+
+    def describe(tools):
+        """ Summarizes one tool table. """
+        return [{'tool': x.number, 'diameter_mm': x.diameter,
+                 'diameter_inch': x.diameter / 25.4, 'holes': len(x.holes),
+                 'slots': x.slot_count} for x in tools]
+
+    return {'plated': describe(plated_tools),
+            'unplated': describe(unplated_tools)}
+
+
+def write_report(handle, report, title=""):
+    """ Writes a drill report in the same layout as KiCAD's, so that
+    existing report-parsing tools keep working. """
+
+    handle.write("Drill report for %s\n" % title)
+    handle.write("Created on %s\n\n" % time.strftime("%Y-%m-%d %H:%M:%S"))
+
+    sections = [("Plated through holes", report['plated']),
+                ("Not plated through holes", report['unplated'])]
+
+    for heading, tools in sections:
+        if not tools:
+            continue
+
+        handle.write("%s:\n" % heading)
+        for tool in tools:
+            if tool['slots']:
+                count = "%d holes with %d slots" % (tool['holes'],
+                                                    tool['slots'])
+            else:
+                count = "%d holes" % tool['holes']
+            handle.write("    T%d  %.3fmm  %.4f\"  (%s)\n" %
+                         (tool['tool'], tool['diameter_mm'],
+                          tool['diameter_inch'], count))
+        handle.write("\n    Total %s count %d\n\n" %
+                     (heading.lower(), sum(x['holes'] for x in tools)))
@@ -11,7 +11,13 @@ import sys
 import tempfile
 import shutil
 
-import pcbnew
+try:
+    import pcbnew
+except ImportError:
+    pcbnew = None
+
+import drill_writer
+import kicad_pcb
 
 __version__ = "1.0"
 
@@ -28,23 +34,12 @@ def sanitize(path):
     return path
 
 
-def check_drills(allowed_drill_file, drill_report_file, metric=False):
-    """ Verifies that the drills called out in a KiCAD drill report can all
-    be found in a whitelisted drill file. Returns 'True' if all drill
-    selections are valid, and 'False' otherwise. """
+def check_drill_sizes(allowed_drill_file, used_drills):
+    """ Verifies that a list of drill diameters (in inches) can all be found
+    in a whitelisted drill file. Returns 'True' if all drill selections are
+    valid, and 'False' otherwise. """
 
     allowed_drill_data = open(allowed_drill_file, 'r').read()
-    drill_report_data = open(drill_report_file, 'r').read()
-
-    used_drills = []
-    matches = re.findall('^[ \t]*T[0-9]+[ \t].+$', drill_report_data,
-                         flags=re.M)
-
-    for match in matches:
-        match = match.strip().split()
-        drill = float(match[2][:-1])
-        used_drills.append(drill)
-
     allowed_drills = []
 
     for line in allowed_drill_data.split('\n'):
@@ -52,9 +47,6 @@ def check_drills(allowed_drill_file, drill_report_file, metric=False):
         if line != "":
             allowed_drills.append(float(line))
 
-    if metric:
-        allowed_drills = [x / 25.4 for x in matches]
-
     for used_drill in used_drills:
         match = False
         for allowed_drill in allowed_drills:
@@ -63,7 +55,7 @@ def check_drills(allowed_drill_file, drill_report_file, metric=False):
                 break
 
         if match is False:
-            msg = "Error: Drill [%0.04f mils / %0.01f mm] not in whitelist.\n"
+            msg = "Error: Drill [%0.04f in / %0.03f mm] not in whitelist.\n"
             msg = msg % (used_drill, used_drill * 25.4)
             sys.stderr.write(msg)
             return False
@@ -71,12 +63,109 @@ def check_drills(allowed_drill_file, drill_report_file, metric=False):
     return True
 
 
-def generate_drill_files(args):
+def check_drills(allowed_drill_file, drill_report_file):
+    """ Verifies that the drills called out in a KiCAD drill report can all
+    be found in a whitelisted drill file. The report lists every tool in
+    both millimeters and inches; the inch column is used regardless of the
+    output units. Returns 'True' if all drill selections are valid, and
+    'False' otherwise. """
+
+    drill_report_data = open(drill_report_file, 'r').read()
+
+    used_drills = []
+    matches = re.findall('^[ \t]*T[0-9]+[ \t].+$', drill_report_data,
+                         flags=re.M)
+
+    for match in matches:
+        match = match.strip().split()
+        drill = float(match[2][:-1])
+        used_drills.append(drill)
+
+    return check_drill_sizes(allowed_drill_file, used_drills)
+
+
+def copy_outputs(tempdir, output_dir):
+    """ Copies every generated file from the scratch directory into the
+    output directory, creating it if needed. Returns 0 on success, or 1
+    otherwise. """
+
+    if not os.path.isdir(output_dir):
+        try:
+            os.mkdir(output_dir)
+        except OSError:
+            err_msg = "Error: Couldn't make output directory [%s]" % output_dir
+            sys.stderr.write(err_msg + "\n")
+            return 1
+
+    for filename in os.listdir(tempdir):
+        filename = os.path.join(tempdir, filename)
+        shutil.copy(filename, output_dir)
+
+    return 0
+
+
+def generate_headless_drill_files(args):
+    """ Generates the drill files and drill report for a KiCAD design
+    without pcbnew, by reading the .kicad_pcb file directly. The whitelist
+    and slot checks run on the collected holes rather than on the text
+    report. Returns 0 if everything was successful, or 1 otherwise. """
+
+    pcb_file = sanitize(args.pcb_file)
+    output_dir = sanitize(args.output_dir)
+    file_base = os.path.splitext(os.path.basename(pcb_file))[0]
+
+    board = kicad_pcb.load_board(pcb_file)
+    origin_point = kicad_pcb.get_aux_origin(board)
+    holes = drill_writer.collect_holes(board)
+
+    plated_tools = drill_writer.make_tools([x for x in holes if x.plated],
+                                           args.bin_tolerance)
+    unplated_tools = drill_writer.make_tools(
+        [x for x in holes if not x.plated], args.bin_tolerance)
+    report = drill_writer.make_report(plated_tools, unplated_tools)
+
+    if args.check != "":
+        used_drills = [x['diameter_inch'] for x in
+                       report['plated'] + report['unplated']]
+        if not check_drill_sizes(sanitize(args.check), used_drills):
+            return 1
+
+    if args.no_slots:
+        for tool in report['plated'] + report['unplated']:
+            if tool['slots'] != 0:
+                sys.stderr.write("Error: One or more slots reported in ")
+                sys.stderr.write("design.\nT%d: %d slots\n" %
+                                 (tool['tool'], tool['slots']))
+                return 1
+
+    outputs = [("PTH", plated_tools), ("NPTH", unplated_tools)]
+    for suffix, tools in outputs:
+        if not tools:
+            continue
+        filename = os.path.join(args.tempdir,
+                                "%s-%s.drl" % (file_base, suffix))
+        with open(filename, 'w') as handle:
+            drill_writer.write_excellon(handle, tools, origin_point,
+                                        args.metric,
+                                        os.path.basename(pcb_file))
+
+    filename = os.path.join(args.tempdir, "%s-drill_report.txt" % file_base)
+    with open(filename, 'w') as handle:
+        drill_writer.write_report(handle, report, os.path.basename(pcb_file))
+
+    return copy_outputs(args.tempdir, output_dir)
+
+
+def generate_drill_files(args, board=None):
     """ Generates the drill files for a KiCAD design, including a drill
     report. The options/arguments consumed by this function are all provided
-    by the argument parser. Returns 0 if everything was successful, or 1
+    by the argument parser. An already-loaded board can be supplied to skip
+    loading it from disk. Returns 0 if everything was successful, or 1
     otherwise. """
 
+    if args.backend == "python":
+        return generate_headless_drill_files(args)
+
     pcb_file = sanitize(args.pcb_file)
     output_dir = sanitize(args.output_dir)
 
@@ -84,7 +173,9 @@ def generate_drill_files(args):
     drill_report_file = "%s-drill_report.txt" % file_base
     drill_report_file = os.path.join(args.tempdir, drill_report_file)
 
-    board = pcbnew.LoadBoard(pcb_file)
+    if board is None:
+        board = pcbnew.LoadBoard(pcb_file)
+
     origin_point = board.GetAuxOrigin()
 
     writer = pcbnew.EXCELLON_WRITER(board)
@@ -96,8 +187,7 @@ def generate_drill_files(args):
     writer.CreateDrillandMapFilesSet(args.tempdir, True, True)
 
     if args.check != "":
-        drills_ok = check_drills(sanitize(args.check), drill_report_file,
-                                 args.metric)
+        drills_ok = check_drills(sanitize(args.check), drill_report_file)
         if drills_ok is False:
             return 1
 
@@ -109,19 +199,7 @@ def generate_drill_files(args):
                 sys.stderr.write("design.\n%s" % line)
                 return 1
 
-    if not os.path.isdir(output_dir):
-        try:
-            os.mkdir(output_dir)
-        except OSError:
-            err_msg = "Error: Couldn't make output directory [%s]" % output_dir
-            sys.stderr.write(err_msg + "\n")
-            return 1
-
-    for filename in os.listdir(args.tempdir):
-        filename = os.path.join(args.tempdir, filename)
-        shutil.copy(filename, output_dir)
-
-    return 0
+    return copy_outputs(args.tempdir, output_dir)
 
 
 def make_parser():
@@ -154,6 +232,18 @@ def make_parser():
                         help="Refuse to generate outputs if slots are " +
                         "present in the design")
 
+    parser.add_argument('-b', '--backend', choices=["kicad", "python"],
+                        default="kicad" if pcbnew is not None else "python",
+                        help="Drill-file generator to use. 'python' reads " +
+                        "the board directly and doesn't need KiCAD " +
+                        "(default: kicad if pcbnew is installed)")
+
+    parser.add_argument('-t', '--bin_tolerance', type=float,
+                        default=drill_writer.DEFAULT_BIN_TOLERANCE,
+                        help="Python backend only: merge drill sizes " +
+                        "within this many mm into one tool (default: " +
+                        "%(default)s)")
+
     version_string = "%(prog)s" + " v%s" % __version__
     parser.add_argument('--version', action='version', version=version_string)
 
@@ -172,6 +262,11 @@ def main():
         sys.stderr.write("Error: can't open file [%s]\n" % args.pcb_file)
         sys.exit(1)
 
+    if args.backend == "kicad" and pcbnew is None:
+        sys.stderr.write("Error: the kicad backend needs pcbnew, which " +
+                         "isn't installed (use '-b python').\n")
+        sys.exit(1)
+
     args.tempdir = tempfile.mkdtemp(prefix="tmp.kicad_drill-")
 
     try:
@@ -27,15 +27,18 @@ def sanitize(path):
     return path
 
 
-def generate_gerbers(args):
+def generate_gerbers(args, plotter=None):
     """ Generates Gerber output files from a Kicad PCB design. Uses the
-    arguments constructed elsewhere in this script. """
+    arguments constructed elsewhere in this script. An already-loaded
+    PLOT_CONTROLLER can be supplied to skip loading the board. """
 
     pcb_file = sanitize(args.pcb_file)
     output_dir = sanitize(args.output_dir)
 
-    board = pcbnew.LoadBoard(pcb_file)
-    plotter = pcbnew.PLOT_CONTROLLER(board)
+    if plotter is None:
+        board = pcbnew.LoadBoard(pcb_file)
+        plotter = pcbnew.PLOT_CONTROLLER(board)
+
     options = plotter.GetPlotOptions()
 
     options.SetPlotFrameRef(False)
@@ -94,6 +97,8 @@ def generate_gerbers(args):
                              layer_info[2])
         plotter.PlotLayer()
 
+    plotter.ClosePlot()
+
     if not os.path.isdir(output_dir):
         try:
             os.mkdir(output_dir)
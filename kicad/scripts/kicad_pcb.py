@@ -0,0 +1,315 @@
+""" Lightweight reader for KiCAD .kicad_pcb files. Parses the board's
+s-expression data directly, so that analysis scripts can run without a
+KiCAD/pcbnew installation. Items are returned as plain dicts and tuples in
+board coordinates (millimeters, Y pointing down). """
+
+import math
+import re
+
+TOKEN_REGEX = re.compile(r'"((?:[^"\\]|\\.)*)"|([()])|([^\s()"]+)')
+
+
+def parse_sexpr(data):
+    """ Parses an s-expression string into nested lists. Atoms and quoted
+    strings are both returned as strings. Returns the first top-level
+    expression. """
+
+    stack = [[]]
+
+    for quoted, paren, atom in TOKEN_REGEX.findall(data):
+        if paren == "(":
+            node = []
+            stack[-1].append(node)
+            stack.append(node)
+        elif paren == ")":
+            stack.pop()
+        elif atom != "":
+            stack[-1].append(atom)
+        else:
+            stack[-1].append(quoted.replace('\\"', '"').replace('\\\\', '\\'))
+
+    return stack[0][0]
+
+
+def load_board(pcb_file):
+    """ Reads and parses a .kicad_pcb file. Returns the root node. """
+
+    with open(pcb_file, 'r') as handle:
+        board = parse_sexpr(handle.read())
+
+    if board[0] != "kicad_pcb":
+        raise ValueError("[%s] is not a KiCAD PCB file" % pcb_file)
+
+    return board
+
+
+def children(node, name):
+    """ Yields every child list of a node whose head is 'name'. """
+
+    for item in node:
+        if isinstance(item, list) and item and item[0] == name:
+            yield item
+
+
+def child(node, name):
+    """ Returns the first child list of a node whose head is 'name', or
+    None if there isn't one. """
+
+    for item in children(node, name):
+        return item
+    return None
+
+
+def child_map(node):
+    """ Returns a dict mapping each child list's head to the first child
+    with that head, so that several children of one node can be looked up
+    with a single scan. """
+
+    result = {}
+    for item in node:
+        if isinstance(item, list) and item and item[0] not in result:
+            result[item[0]] = item
+    return result
+
+
+def item_float(item, default=None):
+    """ Returns the first argument of a child list as a float, or 'default'
+    if the child is missing (None) or empty. """
+
+    if item is None or len(item) < 2:
+        return default
+    return float(item[1])
+
+
+def child_float(node, name, default=None):
+    """ Returns the first argument of a named child as a float, or
+    'default' if the child isn't present. """
+
+    return item_float(child(node, name), default)
+
+
+def get_setup_value(board, name, default=None):
+    """ Returns a numeric value from the board's (setup) section. """
+
+    return child_float(child(board, "setup"), name, default)
+
+
+def get_aux_origin(board):
+    """ Returns the board's auxiliary axis origin as an (x, y) tuple. """
+
+    item = child(child(board, "setup"), "aux_axis_origin")
+    if item is None:
+        return (0.0, 0.0)
+    return (float(item[1]), float(item[2]))
+
+
+def get_layers(board):
+    """ Returns the names of all layers defined by the board, in stack
+    order. """
+
+    return [item[1] for item in child(board, "layers")[1:]]
+
+
+def get_copper_layers(board):
+    """ Returns the names of the board's copper layers, top to bottom. """
+
+    return [x for x in get_layers(board) if x.endswith(".Cu")]
+
+
+def expand_layers(names, board_layers):
+    """ Expands KiCAD layer wildcards ('*.Cu', 'F&B.Cu', ...) against a
+    board's layer list. Returns a list of concrete layer names. """
+
+    result = []
+    for name in names:
+        if name.startswith("*."):
+            suffix = name[1:]
+            result += [x for x in board_layers if x.endswith(suffix)]
+        elif name.startswith("F&B."):
+            result += ["F." + name[4:], "B." + name[4:]]
+        else:
+            result.append(name)
+
+    return [x for x in board_layers if x in result]
+
+
+def get_nets(board):
+    """ Returns a dict mapping net codes to net names. """
+
+    return dict((int(item[1]), item[2]) for item in children(board, "net"))
+
+
+def rotate(x, y, angle):
+    """ Rotates a point about the origin by 'angle' degrees, using KiCAD's
+    rotation convention (counter-clockwise on screen, Y pointing down). """
+
+    if angle == 0:
+        return (x, y)
+
+    radians = math.radians(angle)
+    cosine = math.cos(radians)
+    sine = math.sin(radians)
+    return (x * cosine + y * sine, y * cosine - x * sine)
+
+
+def _parse_pad(item, module):
+    """ Converts a (pad ...) node into a dict, with its position translated
+    into board coordinates. """
+
+    nodes = child_map(item)
+    at = nodes["at"]
+    size = nodes["size"]
+    offset_x, offset_y = rotate(float(at[1]), float(at[2]),
+                                module['rotation'])
+
+    pad = {
+        'number': item[1],
+        'type': item[2],
+        'shape': item[3],
+        'x': module['x'] + offset_x,
+        'y': module['y'] + offset_y,
+        'rotation': float(at[3]) if len(at) > 3 else 0.0,
+        'width': float(size[1]),
+        'height': float(size[2]),
+        'layers': nodes["layers"][1:],
+        'roundrect_ratio': item_float(nodes.get("roundrect_rratio"), 0.0),
+        'solder_mask_margin': item_float(nodes.get("solder_mask_margin")),
+        'solder_paste_margin': item_float(nodes.get("solder_paste_margin")),
+        'solder_paste_ratio': item_float(
+            nodes.get("solder_paste_margin_ratio")),
+        'drill': None,
+        'drill_offset': (0.0, 0.0),
+        'net': 0,
+        'net_name': "",
+    }
+
+    drill = nodes.get("drill")
+    if drill is not None:
+        words = [x for x in drill[1:] if not isinstance(x, list)]
+        if words and words[0] == "oval":
+            words = words[1:]
+        if words:
+            width = float(words[0])
+            height = float(words[1]) if len(words) > 1 else width
+            pad['drill'] = (width, height)
+        offset = child(drill, "offset")
+        if offset is not None:
+            pad['drill_offset'] = rotate(float(offset[1]), float(offset[2]),
+                                         pad['rotation'])
+
+    net = nodes.get("net")
+    if net is not None:
+        pad['net'] = int(net[1])
+        pad['net_name'] = net[2] if len(net) > 2 else ""
+
+    return pad
+
+
+def get_modules(board):
+    """ Returns a list of every module (footprint) on the board. Each module
+    is a dict that includes its reference, value, placement and a list of
+    pad dicts in board coordinates. """
+
+    modules = []
+
+    for item in children(board, "module"):
+        # One pass over the module's (many) children collects everything.
+        nodes = {}
+        texts = []
+        pads = []
+        for entry in item:
+            if not isinstance(entry, list) or not entry:
+                continue
+            if entry[0] == "pad":
+                pads.append(entry)
+            elif entry[0] == "fp_text":
+                texts.append(entry)
+            elif entry[0] not in nodes:
+                nodes[entry[0]] = entry
+
+        at = nodes["at"]
+        module = {
+            'name': item[1],
+            'footprint': item[1].split(":")[-1],
+            'layer': nodes["layer"][1],
+            'x': float(at[1]),
+            'y': float(at[2]),
+            'rotation': float(at[3]) if len(at) > 3 else 0.0,
+            'reference': "",
+            'value': "",
+            'solder_mask_margin': item_float(nodes.get("solder_mask_margin")),
+            'solder_paste_margin': item_float(
+                nodes.get("solder_paste_margin")),
+            'solder_paste_ratio': item_float(
+                nodes.get("solder_paste_margin_ratio")),
+        }
+
+        for text in texts:
+            if text[1] in ["reference", "value"]:
+                module[text[1]] = text[2]
+
+        module['pads'] = [_parse_pad(x, module) for x in pads]
+        modules.append(module)
+
+    return modules
+
+
+def get_segments(board):
+    """ Returns every track segment as an (x1, y1, x2, y2, width, layer,
+    net) tuple. """
+
+    segments = []
+
+    for item in children(board, "segment"):
+        nodes = child_map(item)
+        start = nodes["start"]
+        end = nodes["end"]
+        segments.append((float(start[1]), float(start[2]),
+                         float(end[1]), float(end[2]),
+                         item_float(nodes.get("width")),
+                         nodes["layer"][1],
+                         int(nodes["net"][1])))
+
+    return segments
+
+
+def get_vias(board):
+    """ Returns every via as an (x, y, size, drill, layers, net) tuple. The
+    'layers' entry is a tuple holding the via's two end layers. """
+
+    vias = []
+    default_drill = get_setup_value(board, "via_drill", 0.0)
+
+    for item in children(board, "via"):
+        nodes = child_map(item)
+        at = nodes["at"]
+        vias.append((float(at[1]), float(at[2]),
+                     item_float(nodes.get("size")),
+                     item_float(nodes.get("drill"), default_drill),
+                     tuple(nodes["layers"][1:]),
+                     int(nodes["net"][1])))
+
+    return vias
+
+
+def get_zones(board):
+    """ Returns every copper zone as a dict holding its net, layer and the
+    list of filled polygons (each a list of (x, y) tuples). """
+
+    zones = []
+
+    for item in children(board, "zone"):
+        polygons = []
+        for polygon in children(item, "filled_polygon"):
+            points = child(polygon, "pts")
+            polygons.append([(float(x[1]), float(x[2]))
+                             for x in children(points, "xy")])
+
+        zones.append({
+            'net': int(child(item, "net")[1]),
+            'net_name': child(item, "net_name")[1],
+            'layer': child(item, "layer")[1],
+            'polygons': polygons,
+        })
+
+    return zones
@@ -0,0 +1,447 @@
+#!/usr/bin/env python3
+
+""" Standalone command-line script for stepping single-board Gerber and
+Excellon outputs (as written by generate_gerbers.py and generate_drills.py)
+into an N x M production panel. Input files are streamed rather than loaded,
+so memory use doesn't depend on the panel size. """
+
+import argparse
+import os
+import re
+import sys
+
+__version__ = "1.0"
+
+DRILL_EXTENSIONS = [".drl", ".xln"]
+
+GERBER_HEADER_CODES = ["FS", "MO", "AD", "AM", "IP", "IN", "OF", "SF", "TF"]
+
+GERBER_WORD_REGEX = re.compile(
+    r"^(G\d+)?(?:X([+-]?\d+))?(?:Y([+-]?\d+))?(?:I([+-]?\d+))?"
+    r"(?:J([+-]?\d+))?(?:D(\d+))?\*$")
+
+EXCELLON_TOOL_REGEX = re.compile(r"^T(\d+)C([\d.]+)")
+
+
+def sanitize(path):
+    """ Runs a number of path transformations to clean up and normalize
+    an user-supplied path. """
+
+    path = os.path.expanduser(path)
+    path = os.path.expandvars(path)
+    path = os.path.normcase(path)
+    path = os.path.normpath(path)
+    path = os.path.abspath(path)
+    return path
+
+
+def panel_offsets(columns, rows, pitch_x, pitch_y):
+    """ Yields the (x, y) offset of each copy in the panel, in millimeters,
+    row by row. Offsets use Gerber/Excellon axes (Y pointing up). """
+
+    for row in range(rows):
+        for column in range(columns):
+            yield (column * pitch_x, row * pitch_y)
+
+
+def gerber_statements(gerber_file):
+    """ Yields the statements of a Gerber file one at a time. Extended
+    commands are yielded whole (including their '%' delimiters); ordinary
+    words are yielded with their trailing '*'. """
+
+    pending = ""
+
+    with open(gerber_file, 'r') as handle:
+        for line in handle:
+            pending += line.strip()
+
+            if pending.startswith("%"):
+                if len(pending) > 1 and pending.endswith("%"):
+                    yield pending
+                    pending = ""
+                continue
+
+            words = pending.split("*")
+            for word in words[:-1]:
+                if word != "":
+                    yield word + "*"
+            pending = words[-1]
+
+
+def scan_gerber(gerber_file):
+    """ Makes a single pass over a Gerber file to collect everything that
+    has to be written once at the top of a panel: the header statements,
+    the coordinate format and units, and a deduplicated aperture table.
+    Returns a dict describing the file. """
+
+    info = {
+        'header': [],
+        'macros': [],
+        'apertures': [],
+        'remap': {},
+        'integer_digits': 3,
+        'decimal_digits': 6,
+        'trailing_zeros': False,
+        'scale': 1.0,
+    }
+
+    definitions = {}
+    in_header = True
+
+    for statement in gerber_statements(gerber_file):
+        code = statement[1:3] if statement.startswith("%") else ""
+
+        if code == "AD":
+            match = re.match(r"^%ADD(\d+)([^*]*)\*%$", statement)
+            number, template = int(match.group(1)), match.group(2)
+            if template not in definitions:
+                definitions[template] = 10 + len(definitions)
+                info['apertures'].append("%%ADD%d%s*%%" %
+                                         (definitions[template], template))
+            info['remap'][number] = definitions[template]
+            continue
+
+        if code == "AM":
+            if statement not in info['macros']:
+                info['macros'].append(statement)
+            continue
+
+        if code == "FS":
+            match = re.match(r"^%FS([LTD])A.*X(\d)(\d)Y\d\d\*%$", statement)
+            info['trailing_zeros'] = match.group(1) == "T"
+            info['integer_digits'] = int(match.group(2))
+            info['decimal_digits'] = int(match.group(3))
+            continue
+
+        if code == "MO":
+            info['scale'] = 1.0 / 25.4 if "IN" in statement else 1.0
+
+        if in_header:
+            if code in GERBER_HEADER_CODES or statement.startswith("G04") or \
+                    re.match(r"^G(70|71|90|91)\*$", statement):
+                info['header'].append(statement)
+            else:
+                in_header = False
+
+    return info
+
+
+def parse_gerber_number(text, info):
+    """ Converts a Gerber coordinate string into an integer count of the
+    file's smallest unit. """
+
+    if info['trailing_zeros']:
+        sign = ""
+        if text[0] in "+-":
+            sign, text = text[0], text[1:]
+        digits = info['integer_digits'] + info['decimal_digits']
+        text = sign + text.ljust(digits, "0")
+    return int(text)
+
+
+def write_gerber_copy(gerber_file, handle, info, offset):
+    """ Streams the body of a Gerber file into an open panel file, shifted
+    by 'offset' (in millimeters). Coordinates are always written in full so
+    that modal values never leak between copies. """
+
+    unit = 10 ** info['decimal_digits'] * info['scale']
+    dx = int(round(offset[0] * unit))
+    dy = int(round(offset[1] * unit))
+    x_pos, y_pos = 0, 0
+    in_header = True
+
+    for statement in gerber_statements(gerber_file):
+        if statement.startswith("%"):
+            if statement[1:3] in GERBER_HEADER_CODES:
+                continue
+            handle.write(statement + "\n")
+            continue
+
+        if statement.startswith("G04") or statement.startswith("M02"):
+            continue
+
+        match = GERBER_WORD_REGEX.match(statement)
+        if match is None:
+            handle.write(statement + "\n")
+            continue
+
+        gcode, x_text, y_text, i_text, j_text, dcode = match.groups()
+
+        if in_header and dcode is None and x_text is None and \
+                y_text is None and gcode in ["G70", "G71", "G90", "G91"]:
+            continue
+        in_header = False
+
+        if dcode is not None and int(dcode) >= 10:
+            handle.write("%sD%d*\n" % (gcode or "",
+                                       info['remap'][int(dcode)]))
+            continue
+
+        if x_text is None and y_text is None:
+            handle.write(statement + "\n")
+            continue
+
+        if x_text is not None:
+            x_pos = parse_gerber_number(x_text, info)
+        if y_text is not None:
+            y_pos = parse_gerber_number(y_text, info)
+
+        word = "%sX%dY%d" % (gcode or "", x_pos + dx, y_pos + dy)
+        if i_text is not None:
+            word += "I%d" % parse_gerber_number(i_text, info)
+        if j_text is not None:
+            word += "J%d" % parse_gerber_number(j_text, info)
+        if dcode is not None:
+            word += "D%02d" % int(dcode)
+        handle.write(word + "*\n")
+
+
+def panelize_gerber(gerber_file, output_file, offsets):
+    """ Writes a panelized copy of a Gerber file. """
+
+    info = scan_gerber(gerber_file)
+
+    with open(output_file, 'w') as handle:
+        handle.write("%%FSLAX%d%dY%d%d*%%\n" %
+                     (info['integer_digits'], info['decimal_digits'],
+                      info['integer_digits'], info['decimal_digits']))
+        for statement in info['header'] + info['macros'] + info['apertures']:
+            handle.write(statement + "\n")
+
+        for offset in offsets:
+            write_gerber_copy(gerber_file, handle, info, offset)
+
+        handle.write("M02*\n")
+
+
+def scan_excellon(drill_file):
+    """ Reads the header of an Excellon file. Returns a dict holding the
+    units, a deduplicated tool table (ordered by diameter) and a map from
+    each original tool number to its merged tool number. """
+
+    tools = {}
+    metric = False
+
+    with open(drill_file, 'r') as handle:
+        for line in handle:
+            line = line.strip()
+            if line in ["%", "M95"]:
+                break
+            if line.startswith("METRIC"):
+                metric = True
+            match = EXCELLON_TOOL_REGEX.match(line)
+            if match is not None:
+                tools[int(match.group(1))] = float(match.group(2))
+
+    diameters = sorted(set(round(x, 4) for x in tools.values()))
+    numbers = dict((x, n + 1) for n, x in enumerate(diameters))
+    remap = dict((x, numbers[round(tools[x], 4)]) for x in tools)
+
+    return {'metric': metric, 'diameters': diameters, 'remap': remap}
+
+
+def split_excellon_line(line, position):
+    """ Splits an Excellon body line into a list of literal strings and
+    absolute (x, y) coordinate pairs. Coordinates are expected in decimal
+    format (as written by generate_drills.py). Missing (modal) coordinates
+    are filled in from 'position', which is updated in place. """
+
+    parts = []
+    pair = {}
+
+    tokens = re.findall(r"([A-Z])([-+\d.]*)", line)
+    for index, (letter, value) in enumerate(tokens + [("", "")]):
+        if letter in ["X", "Y"]:
+            pair[letter] = float(value)
+            continue
+
+        if pair:
+            position[0] = pair.get("X", position[0])
+            position[1] = pair.get("Y", position[1])
+            parts.append((position[0], position[1]))
+            pair = {}
+
+        if index < len(tokens):
+            parts.append(letter + value)
+
+    return parts
+
+
+def format_excellon_line(parts, offset, decimals):
+    """ Reassembles a line split by split_excellon_line, with every
+    coordinate pair shifted by 'offset'. """
+
+    return "".join(x if isinstance(x, str) else
+                   "X%.*fY%.*f" % (decimals, x[0] + offset[0],
+                                   decimals, x[1] + offset[1])
+                   for x in parts)
+
+
+def panelize_excellon(drill_file, output_file, offsets):
+    """ Writes a panelized copy of an Excellon drill file. Holes are grouped
+    by merged tool, so each tool is only loaded once for the whole panel.
+    The input is streamed once per merged tool, writing every copy of each
+    hole as it's read. """
+
+    info = scan_excellon(drill_file)
+    scale = 1.0 if info['metric'] else 1.0 / 25.4
+    decimals = 3 if info['metric'] else 4
+    offsets = [(x * scale, y * scale) for x, y in offsets]
+
+    with open(output_file, 'w') as handle:
+        handle.write("M48\n")
+        handle.write(";DRILL file panelized by panelize.py\n")
+        handle.write("FMAT,2\n")
+        handle.write("%s,TZ\n" % ("METRIC" if info['metric'] else "INCH"))
+
+        for number, diameter in enumerate(info['diameters']):
+            handle.write("T%dC%.*f\n" % (number + 1, decimals, diameter))
+
+        handle.write("%\nG90\nG05\n")
+        handle.write("%s\n" % ("M71" if info['metric'] else "M72"))
+
+        for number in range(1, len(info['diameters']) + 1):
+            handle.write("T%d\n" % number)
+            write_excellon_tool(drill_file, handle, info, number, offsets,
+                                decimals)
+
+        handle.write("T0\nM30\n")
+
+
+def write_excellon_tool(drill_file, handle, info, number, offsets,
+                        decimals):
+    """ Streams the holes of one merged tool from an Excellon file into an
+    open panel file, writing one copy per offset (in file units) as each
+    hole is read. Routed paths (G00 up to the next G05 or G00) are buffered
+    and written whole for each copy, so that every copy's path stays
+    contiguous. """
+
+    in_body = False
+    selected = False
+    position = [0.0, 0.0]
+    path = []
+
+    def write_copies(lines):
+        """ Writes a run of split body lines once per offset. """
+        for offset in offsets:
+            for parts in lines:
+                handle.write(format_excellon_line(parts, offset, decimals) +
+                             "\n")
+
+    with open(drill_file, 'r') as source:
+        for line in source:
+            line = line.strip()
+
+            if not in_body:
+                in_body = line in ["%", "M95"]
+                continue
+
+            if path and re.match(r"^(T\d+$|M30|M00|G00|G05)", line):
+                write_copies(path)
+                path = []
+
+            match = re.match(r"^T(\d+)$", line)
+            if match is not None:
+                tool = int(match.group(1))
+                selected = info['remap'].get(tool) == number
+                continue
+
+            if line in ["M30", "M00"]:
+                break
+
+            if not selected:
+                continue
+
+            if line.startswith("G00"):
+                path = [split_excellon_line(line, position)]
+            elif path:
+                path.append(split_excellon_line(line, position))
+            elif re.search("[XY]", line):
+                write_copies([split_excellon_line(line, position)])
+            elif re.match(r"^(M15|M16|M17|G0[0-5])", line):
+                handle.write(line + "\n")
+
+    if path:
+        write_copies(path)
+
+
+def make_output_name(input_file, output_dir, suffix):
+    """ Builds the output filename for a panelized copy of 'input_file'. """
+
+    base, extension = os.path.splitext(os.path.basename(input_file))
+    return os.path.join(output_dir, base + suffix + extension)
+
+
+def make_parser():
+    """ Creates the CLI's argparse instance. """
+
+    description = """Script for stepping single-board Gerber and Excellon
+    files into a COLUMNS x ROWS panel. Duplicate apertures and drill tools
+    are merged. Files ending in .drl or .xln are treated as Excellon; all
+    others as Gerber. """
+
+    parser = argparse.ArgumentParser(description=description)
+
+    parser.add_argument('input_files', metavar="FILE", nargs="+",
+                        help="Gerber or Excellon file to panelize.")
+
+    parser.add_argument('-c', '--columns', type=int, default=1,
+                        help="Number of copies along X (default: 1)")
+
+    parser.add_argument('-r', '--rows', type=int, default=1,
+                        help="Number of copies along Y (default: 1)")
+
+    parser.add_argument('-x', '--pitch_x', type=float, required=True,
+                        help="Distance between copies along X, in mm.")
+
+    parser.add_argument('-y', '--pitch_y', type=float, required=True,
+                        help="Distance between copies along Y, in mm.")
+
+    parser.add_argument('-o', '--output_dir', default='.',
+                        help="Output directory (default: '.')")
+
+    parser.add_argument('-s', '--suffix', default='-panel',
+                        help="Suffix added to each output filename " +
+                        "(default: '-panel')")
+
+    version_string = "%(prog)s" + " v%s" % __version__
+    parser.add_argument('--version', action='version', version=version_string)
+
+    parser.epilog = """Copyright 2017, Nicholas Clark."""
+    return parser
+
+
+def main():
+    """ Main function for this script. """
+
+    parser = make_parser()
+    args = parser.parse_args()
+    output_dir = sanitize(args.output_dir)
+
+    if not os.path.isdir(output_dir):
+        try:
+            os.mkdir(output_dir)
+        except OSError:
+            err_msg = "Error: Couldn't make output directory [%s]" % output_dir
+            sys.stderr.write(err_msg + "\n")
+            sys.exit(1)
+
+    offsets = list(panel_offsets(args.columns, args.rows, args.pitch_x,
+                                 args.pitch_y))
+
+    for input_file in args.input_files:
+        input_file = sanitize(input_file)
+        if not os.access(input_file, os.R_OK):
+            sys.stderr.write("Error: can't open file [%s]\n" % input_file)
+            sys.exit(1)
+
+        output_file = make_output_name(input_file, output_dir, args.suffix)
+        extension = os.path.splitext(input_file)[1].lower()
+
+        if extension in DRILL_EXTENSIONS:
+            panelize_excellon(input_file, output_file, offsets)
+        else:
+            panelize_gerber(input_file, output_file, offsets)
+
+if __name__ == "__main__":
+    main()
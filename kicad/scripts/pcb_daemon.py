@@ -0,0 +1,386 @@
+#!/usr/bin/env python2
+
+""" Long-running companion to generate_gerbers.py and generate_drills.py.
+Keeps a KiCAD board (and its plot controller) loaded, polls the board and
+hole-whitelist files for changes, and regenerates only the outputs that
+depend on whatever changed. Other tools can request fresh outputs through a
+local Unix socket. """
+
+import argparse
+import errno
+import os
+import select
+import shutil
+import socket
+import sys
+import tempfile
+import time
+
+import pcbnew
+
+import generate_drills
+import generate_gerbers
+
+sys.path.insert(1, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import bom_export  # pylint: disable=wrong-import-position
+
+__version__ = "1.0"
+
+
+def sanitize(path):
+    """ Runs a number of path transformations to clean up and normalize
+    an user-supplied path. """
+
+    path = os.path.expanduser(path)
+    path = os.path.expandvars(path)
+    path = os.path.normcase(path)
+    path = os.path.normpath(path)
+    path = os.path.abspath(path)
+    return path
+
+
+def get_mtime(path):
+    """ Returns the modification time of a file, or None if the file doesn't
+    exist (or if no path was supplied). """
+
+    if path == "":
+        return None
+
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+
+class BoardDaemon(object):
+    """ Holds the resident board/plot-controller and the state needed to
+    decide which outputs are stale. """
+
+    def __init__(self, args):
+        self.args = args
+        self.board = None
+        self.plotter = None
+        self.pcb_mtime = None
+        self.failed_mtime = None
+        self.check_mtime = None
+        self.pending = {}
+
+    def log(self, message):
+        """ Writes a status message to stdout unless running quietly. """
+
+        if not self.args.quiet:
+            sys.stdout.write("%s\n" % message)
+            sys.stdout.flush()
+
+    @staticmethod
+    def error(message):
+        """ Writes an error message to stderr, even when running quietly. """
+
+        sys.stderr.write("Error: %s\n" % message)
+        sys.stderr.flush()
+
+    def load_board(self):
+        """ (Re)loads the board from disk and builds a fresh plot
+        controller for it. If loading fails, the previously loaded board
+        and plot controller are kept and the error is re-raised. """
+
+        mtime = get_mtime(self.args.pcb_file)
+
+        try:
+            board = pcbnew.LoadBoard(self.args.pcb_file)
+            plotter = pcbnew.PLOT_CONTROLLER(board)
+        except Exception:
+            self.failed_mtime = mtime
+            raise
+
+        self.board = board
+        self.plotter = plotter
+        self.pcb_mtime = mtime
+        self.failed_mtime = None
+        self.log("Loaded board [%s]" % self.args.pcb_file)
+
+    def run_generator(self, prefix, function, resident):
+        """ Runs one of the generator functions against the resident board,
+        in a scratch directory that is removed afterwards. Returns the
+        generator's exit status. """
+
+        job = argparse.Namespace(**vars(self.args))
+        job.tempdir = tempfile.mkdtemp(prefix=prefix)
+
+        try:
+            return function(job, resident)
+        finally:
+            if os.path.exists(job.tempdir):
+                shutil.rmtree(job.tempdir)
+
+    def gerbers(self):
+        """ Regenerates the Gerber outputs. Returns 0 on success. """
+
+        retval = self.run_generator("tmp.kicad_gerber-",
+                                    generate_gerbers.generate_gerbers,
+                                    self.plotter)
+        if retval != 0:
+            self.error("gerber generation failed (status %d)" % retval)
+        else:
+            self.log("Gerbers regenerated")
+        return retval
+
+    def drills(self):
+        """ Regenerates the drill outputs (and re-runs the whitelist and
+        slot checks). Returns 0 on success. """
+
+        retval = self.run_generator("tmp.kicad_drill-",
+                                    generate_drills.generate_drill_files,
+                                    self.board)
+        if retval != 0:
+            self.error("drill generation failed (status %d)" % retval)
+        else:
+            self.log("Drills regenerated")
+        return retval
+
+    def bom(self, outfile=""):
+        """ Writes a BOM from the configured XML netlist. Returns the path
+        of the written file. """
+
+        if self.args.bom_netlist == "":
+            raise ValueError("no netlist configured (use --bom_netlist)")
+
+        if outfile == "":
+            base = os.path.splitext(os.path.basename(self.args.pcb_file))[0]
+            outfile = os.path.join(self.args.output_dir, base + "-bom")
+
+        outfile = bom_export.export_bom(self.args.bom_netlist, outfile,
+                                        quiet=True)
+        self.log("BOM written to [%s]" % outfile)
+        return outfile
+
+    def poll(self):
+        """ Checks the watched files for changes. A change is only acted on
+        once the file's timestamp has been stable for one full polling
+        interval, so that half-written saves are not picked up. """
+
+        stamps = {
+            'pcb': (get_mtime(self.args.pcb_file), self.pcb_mtime),
+            'check': (get_mtime(self.args.check), self.check_mtime),
+        }
+
+        ready = []
+        for name, (current, loaded) in stamps.items():
+            if current is None or current == loaded or \
+                    (name == 'pcb' and current == self.failed_mtime):
+                self.pending.pop(name, None)
+            elif self.pending.get(name) == current:
+                del self.pending[name]
+                ready.append(name)
+            else:
+                self.pending[name] = current
+
+        try:
+            if 'pcb' in ready:
+                self.load_board()
+                self.check_mtime = stamps['check'][0]
+                self.gerbers()
+                self.drills()
+            elif 'check' in ready:
+                self.check_mtime = stamps['check'][0]
+                self.drills()
+        except Exception as err:
+            self.error("regeneration failed: %s" % err)
+
+    def handle_request(self, request):
+        """ Executes a single socket request and returns the response
+        line. Requests are whitespace-separated words; responses start
+        with 'OK' or 'ERROR'. """
+
+        words = request.split()
+        if words == []:
+            return "ERROR empty request"
+
+        command = words[0].lower()
+
+        if command in ["gerber", "drill", "all"]:
+            if get_mtime(self.args.pcb_file) != self.pcb_mtime:
+                self.load_board()
+
+            retval = 0
+            if command in ["gerber", "all"]:
+                retval = retval or self.gerbers()
+            if command in ["drill", "all"]:
+                retval = retval or self.drills()
+
+            if retval != 0:
+                return "ERROR %s generation failed" % command
+            return "OK %s" % self.args.output_dir
+
+        if command == "bom":
+            try:
+                return "OK %s" % self.bom(" ".join(words[1:]))
+            except (ValueError, IOError, OSError) as err:
+                return "ERROR %s" % err
+
+        if command == "reload":
+            self.load_board()
+            return "OK"
+
+        if command == "status":
+            return "OK board=%s loaded=%s" % (self.args.pcb_file,
+                                               time.ctime(self.pcb_mtime))
+
+        if command == "quit":
+            raise SystemExit(0)
+
+        return "ERROR unknown command [%s]" % command
+
+
+def serve_client(daemon, connection):
+    """ Reads one newline-terminated request from a client connection,
+    answers it, and closes the connection. """
+
+    connection.settimeout(5.0)
+    request = b""
+
+    try:
+        while not request.endswith(b"\n"):
+            chunk = connection.recv(4096)
+            if not chunk:
+                break
+            request += chunk
+
+        try:
+            response = daemon.handle_request(request.decode("ascii",
+                                                             "replace"))
+        except SystemExit:
+            connection.sendall(b"OK exiting\n")
+            raise
+        except Exception as err:
+            daemon.error("request failed: %s" % err)
+            response = "ERROR %s" % " ".join(str(err).split())
+
+        connection.sendall((response + "\n").encode("ascii", "replace"))
+    except (socket.error, UnicodeError) as err:
+        daemon.error("client connection failed: %s" % err)
+    finally:
+        connection.close()
+
+
+def open_socket(path):
+    """ Creates the listening Unix socket, replacing a stale socket file
+    left behind by a previous run. """
+
+    try:
+        os.unlink(path)
+    except OSError as err:
+        if err.errno != errno.ENOENT:
+            raise
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    server.listen(5)
+    return server
+
+
+def run_daemon(args):
+    """ Main loop. Serves socket requests and polls the watched files until
+    told to quit. """
+
+    daemon = BoardDaemon(args)
+    daemon.load_board()
+    daemon.check_mtime = get_mtime(args.check)
+
+    server = open_socket(args.socket)
+    daemon.log("Listening on [%s]" % args.socket)
+
+    try:
+        while True:
+            readable = select.select([server], [], [], args.interval)[0]
+            if readable:
+                connection = server.accept()[0]
+                serve_client(daemon, connection)
+            daemon.poll()
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        server.close()
+        if os.path.exists(args.socket):
+            os.unlink(args.socket)
+
+    return 0
+
+
+def make_parser():
+    """ Creates the CLI's argparse instance. """
+
+    description = """Keeps a KiCAD PCB loaded and regenerates its Gerber and
+    drill outputs whenever the board or hole whitelist changes. Accepts the
+    requests 'gerber', 'drill', 'all', 'bom [FILE]', 'reload', 'status' and
+    'quit' (one per connection, newline-terminated) on a Unix socket. """
+
+    parser = argparse.ArgumentParser(description=description)
+
+    parser.add_argument('pcb_file', metavar="PCB_FILE",
+                        help="Target .kicad_pcb file to watch.")
+
+    parser.add_argument('-q', '--quiet', default=False, action="store_true",
+                        help="Suppress the process's normal stdout.")
+
+    parser.add_argument('-o', '--output_dir', default='.',
+                        help="Output directory (default: '.')")
+
+    parser.add_argument('-c', '--check', default='',
+                        help="Check generated drills against a list of " +
+                        "allowed values. The list is watched as well.")
+
+    parser.add_argument('-m', '--metric', default=False, action="store_true",
+                        help="Generate drills in metric (default: imperial).")
+
+    parser.add_argument('-n', '--no_slots', default=False, action="store_true",
+                        help="Refuse to generate drills if slots are " +
+                        "present in the design")
+
+    parser.add_argument('-b', '--bom_netlist', default='',
+                        help="KiCAD XML netlist used for 'bom' requests.")
+
+    parser.add_argument('-s', '--socket', default='',
+                        help="Path of the request socket (default: " +
+                        "PCB_FILE with a .sock extension)")
+
+    parser.add_argument('-i', '--interval', default=1.0, type=float,
+                        help="File polling interval in seconds " +
+                        "(default: 1.0)")
+
+    version_string = "%(prog)s" + " v%s" % __version__
+    parser.add_argument('--version', action='version', version=version_string)
+
+    parser.epilog = """Copyright 2017, Nicholas Clark."""
+    return parser
+
+
+def main():
+    """ Main function for this script. """
+
+    parser = make_parser()
+    args = parser.parse_args()
+    args.pcb_file = sanitize(args.pcb_file)
+    args.output_dir = sanitize(args.output_dir)
+
+    if not os.access(args.pcb_file, os.R_OK):
+        sys.stderr.write("Error: can't open file [%s]\n" % args.pcb_file)
+        sys.exit(1)
+
+    if args.check != "":
+        args.check = sanitize(args.check)
+
+    if args.bom_netlist != "":
+        args.bom_netlist = sanitize(args.bom_netlist)
+
+    # The daemon always has pcbnew loaded, so it drills with KiCAD's writer.
+    args.backend = "kicad"
+
+    if args.socket == "":
+        args.socket = os.path.splitext(args.pcb_file)[0] + ".sock"
+    args.socket = sanitize(args.socket)
+
+    sys.exit(run_daemon(args))
+
+if __name__ == "__main__":
+    main()
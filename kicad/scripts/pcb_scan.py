@@ -0,0 +1,488 @@
+""" Column-oriented scanner for KiCAD .kicad_pcb files. Instead of building
+the full s-expression tree (see kicad_pcb.py), the items of interest are
+pulled straight out of the file text with combined regular expressions,
+and the matched fields are converted into NumPy columns in bulk. This keeps
+boards with millions of tracks or hundreds of thousands of pads practical.
+
+The patterns follow the layout KiCAD itself writes: every item starts on
+its own line, top-level items are indented by two spaces and footprint
+children by four. An item of a scanned kind that doesn't fit that layout
+raises an error instead of being skipped. """
+
+import itertools
+import re
+
+import numpy as np
+
+# A single field value (a number or an unquoted atom), an atom that may be
+# quoted, and the same atom when it isn't captured.
+VALUE = br"([^ ()\n]+)"
+ATOM = br'("(?:[^"\\\n]|\\.)*"|[^ ()"\n]+)'
+SKIPPED_ATOM = b"(?:" + ATOM[1:]
+
+LAYER_TABLE_REGEX = re.compile(br"\(layers\s+((?:\(\d+\s+[^()]*\)\s*)+)\)")
+LAYER_ENTRY_REGEX = re.compile(br"\(\d+\s+" + ATOM)
+
+# The pattern for each kind of item, written from just after its opening
+# parenthesis, and the number of fields it captures. The first field is
+# never empty, which tells the kinds apart in the combined match groups.
+ITEM_PATTERNS = {
+    'net': (br"net (\d+) " + ATOM + br"\)", 2),
+    'module': (
+        br"module " + ATOM + br"[^\n]*\n    \(at " + VALUE + b" " + VALUE +
+        br" ?([^ ()\n]*)\)((?:\n    \((?!fp_|pad )[^\n]*)*)" +
+        br"(?:\n    \(fp_text reference " + ATOM + br")?", 6),
+    'pad': (br"pad ([^\n]+)((?:\n      [^\n]*)*)", 2),
+    'segment': (
+        br"segment \(start " + VALUE + b" " + VALUE + br"\) \(end " +
+        VALUE + b" " + VALUE + br"\) \(width " + VALUE + br"\) \(layer " +
+        ATOM + br"\) \(net (\d+)\)", 7),
+    'via': (
+        br"via (?:(?:blind|micro) )?\(at " + VALUE + b" " + VALUE +
+        br"\) \(size " + VALUE + br"\) (?:\(drill [^()\n]*\) )?" +
+        br"\(layers " + ATOM + b" " + ATOM + br"\) \(net (\d+)\)", 6),
+    'zone': (
+        br"zone \(net (\d+)\) \(net_name " + ATOM + br"\) \(layer " +
+        ATOM + br"\)", 3),
+    'filled_polygon': (
+        br"filled_polygon\s+(?:\(layer [^()]*\)\s+)?\(pts\s+" +
+        br"(\(xy [^()]*\)[^()]*(?:\(xy [^()]*\)[^()]*)*)\)", 1),
+}
+
+# A pad's first line (after '(pad '): its shape, position, size and layers.
+# Every instance of a footprint repeats the same lines, so the scan only
+# keeps the lines whole and each distinct one is parsed once, with this.
+PAD_LINE_REGEX = re.compile(
+    br"(?m)^" + SKIPPED_ATOM + br" [^ ()\n]+ " + VALUE + br" \(at " +
+    VALUE + b" " + VALUE + br" ?([^ ()\n]*)\) \(size " + VALUE + b" " +
+    VALUE + br"\) (?:\(rect_delta [^()\n]*\) )?" +
+    br"(?:\(drill [^()\n]*(?:\(offset [^()\n]*\))?\) )?" +
+    br"\(layers ([^()\n]*)\)([^\n]*)$")
+
+# Items that belong to the closest preceding item of another kind (and
+# are nested, one level deeper, inside it).
+ITEM_OWNERS = {'pad': 'module', 'filled_polygon': 'zone'}
+
+# Optional pad children; modules may set the margins too.
+PAD_FIELDS = [b"roundrect_rratio", b"solder_mask_margin",
+              b"solder_paste_margin", b"solder_paste_margin_ratio"]
+
+XY_REGEX = re.compile(br"\(xy ([^ ()]+) ([^ ()]+)\)")
+
+# Top-level items start on their own line, indented by two spaces.
+ITEM_BOUNDARY = b"\n  ("
+CHUNK_SIZE = 1 << 24
+
+_item_regexes = {}
+
+
+def read_board_data(pcb_file):
+    """ Reads a .kicad_pcb file as bytes for the scan_* functions. """
+
+    with open(pcb_file, 'rb') as handle:
+        data = handle.read()
+
+    if not data.lstrip().startswith(b"(kicad_pcb"):
+        raise ValueError("[%s] is not a KiCAD PCB file" % pcb_file)
+
+    return data
+
+
+def unquote(atom):
+    """ Converts a scanned atom (bytes, possibly quoted) to a string. """
+
+    return unquote_all([atom])[0]
+
+
+def unquote_all(atoms):
+    """ Converts a column of scanned atoms to a list of strings, decoding
+    them all at once. """
+
+    if not len(atoms):
+        return []
+
+    # Atoms never span lines, so they can be split apart again.
+    text = b"\n".join(atoms).decode("utf-8")
+    if '"' not in text:
+        return text.split("\n")
+    return [x[1:-1].replace('\\"', '"').replace('\\\\', '\\')
+            if x.startswith('"') else x for x in text.split("\n")]
+
+
+def categorize(column):
+    """ Replaces a column of bytes that repeats the same few values by
+    indexes into the list of those values (in order of first appearance).
+    Returns the values and the indexes. """
+
+    index = {}
+    codes = np.fromiter((index.setdefault(x, len(index)) for x in column),
+                        np.intp, len(column))
+    return list(index), codes
+
+
+def chunks(data, size=CHUNK_SIZE):
+    """ Splits board data into (start, end) ranges of roughly 'size' bytes,
+    cut only between top-level items so that no item is split. """
+
+    start = 0
+    while start < len(data):
+        end = data.find(ITEM_BOUNDARY, start + size)
+        if end < 0:
+            end = len(data)
+        yield start, end
+        start = end
+
+
+def item_regex(kinds):
+    """ Builds (and caches) the combined regex for a tuple of item kinds.
+    Returns the regex, a dict mapping each kind to the range of groups its
+    pattern captures, and the groups that catch any item of those kinds
+    that the detailed patterns couldn't read. """
+
+    if kinds not in _item_regexes:
+        top = [x for x in kinds if x not in ITEM_OWNERS]
+        nested = [x for x in kinds if x in ITEM_OWNERS]
+        branches = []
+        spans = {}
+        unread = []
+        column = 0
+
+        # Each branch first checks that the line starts an item of one of
+        # its kinds, so that the (many) other lines are skipped quickly.
+        for indent, group in ((b"", top), (b"  ", nested)):
+            if not group:
+                continue
+            names = b"|".join(x.encode("ascii") for x in group)
+            patterns = [ITEM_PATTERNS[x][0] for x in group]
+            branches.append(indent + br"\((?=(?:" + names + br")\s)(?:" +
+                            b"|".join(patterns) + br"|(\S+))")
+            for kind in group:
+                spans[kind] = (column, column + ITEM_PATTERNS[kind][1])
+                column = spans[kind][1]
+            unread.append(column)
+            column += 1
+
+        # Without nested kinds, every match starts with the same literal
+        # text, which the regex engine can search for much faster.
+        pattern = br"\n  " + (branches[0] if len(branches) == 1 else
+                              br"(?:" + b"|".join(branches) + b")")
+        _item_regexes[kinds] = (re.compile(pattern), spans, unread)
+    return _item_regexes[kinds]
+
+
+def scan_items(data, kinds):
+    """ Scans the board data for several kinds of item in a single pass.
+    Yields one dict per chunk of the data, mapping each kind to a 2-d
+    (object) array of the bytes fields its pattern captures. Kinds listed
+    in ITEM_OWNERS also get a '<kind>_owner' array, indexing their owners
+    across the whole board. Only one chunk's matches are held as Python
+    objects at a time. """
+
+    regex, spans, unread = item_regex(tuple(kinds))
+    owned = [x for x in kinds if ITEM_OWNERS.get(x) in kinds]
+    owners_seen = dict((ITEM_OWNERS[x], 0) for x in owned)
+
+    for start, end in chunks(data):
+        matches = regex.findall(data, start, end)
+        rows = np.fromiter(itertools.chain(*matches), object,
+                           len(matches) * regex.groups)
+        rows = rows.reshape(-1, regex.groups)
+        del matches
+
+        for column in unread:
+            failed = rows[rows[:, column] != b"", column]
+            if len(failed):
+                raise ValueError("Couldn't read a (%s ...) item" %
+                                 failed[0].decode("ascii"))
+
+        found = dict((x, rows[:, spans[x][0]] != b"") for x in kinds)
+        result = dict((x, rows[found[x], spans[x][0]:spans[x][1]])
+                      for x in kinds)
+        del rows
+
+        for kind in owned:
+            owner = ITEM_OWNERS[kind]
+            index = np.cumsum(found[owner]) - 1 + owners_seen[owner]
+            result[kind + "_owner"] = index[found[kind]]
+            if (result[kind + "_owner"] < 0).any():
+                raise ValueError("Found a (%s ...) item outside of any " %
+                                 kind + "(%s ...) item" % owner)
+
+        for owner in owners_seen:
+            owners_seen[owner] += int(found[owner].sum())
+
+        yield result
+
+
+def to_float(column, default=np.nan):
+    """ Converts a column of bytes to floats; empty cells become
+    'default'. """
+
+    result = np.full(len(column), default, dtype=float)
+    present = column != b""
+    result[present] = column[present].astype(float)
+    return result
+
+
+def optional_fields(rest, names):
+    """ Extracts optional numeric children ('(name value)') from a column of
+    item remainders (bytes). Returns a (items x names) array, with NaN
+    where an item doesn't set a field. """
+
+    values = np.full((len(rest), len(names)), np.nan)
+    if not len(rest):
+        return values
+
+    # One search over all of the remainders; each match is traced back to
+    # its item through the items' end offsets.
+    text = b"\n".join(rest)
+    ends = np.cumsum(np.fromiter(map(len, rest), np.intp, len(rest)) + 1)
+    regex = re.compile(br"\((" + b"|".join(names) + br") ([^ ()]+)\)")
+    found = [(x.start(), x.group(1), x.group(2))
+             for x in regex.finditer(text)]
+
+    if found:
+        starts, keys, numbers = zip(*found)
+        items = np.searchsorted(ends, starts, side="right")
+        columns = [names.index(x) for x in keys]
+        values[items, columns] = np.array(numbers, dtype=bytes).astype(float)
+
+    return values
+
+
+def scan_layers(data):
+    """ Returns the names of all layers defined by the board, in stack
+    order. """
+
+    table = LAYER_TABLE_REGEX.search(data)
+    if table is None:
+        return []
+    return [unquote(x) for x in LAYER_ENTRY_REGEX.findall(table.group(1))]
+
+
+def scan_copper_layers(data):
+    """ Returns the names of the board's copper layers, top to bottom. """
+
+    return [x for x in scan_layers(data) if x.endswith(".Cu")]
+
+
+def scan_setup_value(data, name, default=None):
+    """ Returns a numeric value from the board's (setup) section. """
+
+    start = data.find(b"\n  (setup")
+    if start < 0:
+        return default
+
+    end = data.find(b"\n  )", start)
+    match = re.compile(br"\(" + name.encode("ascii") + br"\s+" + VALUE +
+                       br"\)").search(data, start, end)
+    return float(match.group(1)) if match is not None else default
+
+
+def net_fields(chunk):
+    """ Keeps a chunk's net fields as they are. """
+
+    return {'nets': chunk['net']}
+
+
+def segment_fields(chunk):
+    """ Converts a chunk's segment fields into columns. """
+
+    rows = chunk['segment']
+    return {'numbers': rows[:, :5].astype(float),
+            'layer': rows[:, 5].astype(bytes),
+            'net': rows[:, 6].astype(np.intp)}
+
+
+def via_fields(chunk):
+    """ Converts a chunk's via fields into columns. """
+
+    rows = chunk['via']
+    return {'numbers': rows[:, :3].astype(float),
+            'layers': rows[:, 3:5].astype(bytes),
+            'net': rows[:, 5].astype(np.intp)}
+
+
+def pad_fields(chunk):
+    """ Keeps a chunk's pad lines and (few) module fields as they are, and
+    reads the optional fields from the pads' other lines. """
+
+    rows = chunk['pad']
+    return {'modules': chunk['module'],
+            'module': chunk['pad_owner'],
+            'line': rows[:, 0].copy(),
+            'optional': optional_fields(rows[:, 1], PAD_FIELDS)}
+
+
+def zone_fields(chunk):
+    """ Keeps a chunk's zone and filled-polygon fields as they are. """
+
+    return {'zones': chunk['zone'],
+            'points': chunk['filled_polygon'][:, 0],
+            'zone': chunk['filled_polygon_owner']}
+
+
+def net_columns(fields):
+    """ Returns a dict mapping net codes to net names. """
+
+    nets = fields['nets']
+    return dict(zip(map(int, nets[:, 0]), unquote_all(nets[:, 1])))
+
+
+def segment_columns(fields):
+    """ Returns every track segment as a dict of columns: 'x1', 'y1', 'x2',
+    'y2', 'width' (floats), 'net' (ints) and 'layer' (indexes into the
+    'layer_names' list). """
+
+    numbers = fields['numbers']
+    layer_names, layers = np.unique(fields['layer'], return_inverse=True)
+
+    return {
+        'x1': numbers[:, 0], 'y1': numbers[:, 1],
+        'x2': numbers[:, 2], 'y2': numbers[:, 3],
+        'width': numbers[:, 4],
+        'layer': layers.ravel().astype(np.intp),
+        'layer_names': [unquote(x) for x in layer_names],
+        'net': fields['net'],
+    }
+
+
+def via_columns(fields):
+    """ Returns every via as a dict of columns: 'x', 'y', 'size' (floats),
+    'net' (ints), and 'start'/'end' (indexes into the 'layer_names'
+    list). """
+
+    numbers = fields['numbers']
+    layer_names, layers = np.unique(fields['layers'], return_inverse=True)
+    layers = layers.reshape(-1, 2).astype(np.intp)
+
+    return {
+        'x': numbers[:, 0], 'y': numbers[:, 1], 'size': numbers[:, 2],
+        'start': layers[:, 0], 'end': layers[:, 1],
+        'layer_names': [unquote(x) for x in layer_names],
+        'net': fields['net'],
+    }
+
+
+def pad_columns(fields):
+    """ Returns every pad as a dict of columns, in board coordinates:
+    'module' (index into the module columns), 'shape' (index into the
+    'shape_names' list), 'x', 'y', 'rotation', 'width', 'height',
+    'roundrect_ratio', 'solder_mask_margin', 'solder_paste_margin',
+    'solder_paste_ratio' (NaN where the pad doesn't set its own) and
+    'layers' (index into the 'layer_lists' list of layer-name tuples).
+    'modules' holds the columns of every module: 'name', 'footprint' and
+    'reference' (lists of strings) and the three margins. """
+
+    rows = fields['modules']
+    margins = optional_fields(rows[:, 4], PAD_FIELDS[1:])
+    names = unquote_all(rows[:, 0])
+    footprints = dict((x, x.split(":")[-1]) for x in set(names))
+    modules = {
+        'name': names,
+        'footprint': [footprints[x] for x in names],
+        'reference': unquote_all(rows[:, 5]),
+        'solder_mask_margin': margins[:, 0],
+        'solder_paste_margin': margins[:, 1],
+        'solder_paste_ratio': margins[:, 2],
+    }
+
+    lines, line = categorize(fields['line'])
+    parsed = PAD_LINE_REGEX.findall(b"\n".join(lines))
+    if len(parsed) != len(lines):
+        raise ValueError("Couldn't read a (pad ...) item")
+    parsed = np.fromiter(itertools.chain(*parsed), object,
+                         len(parsed) * 8).reshape(-1, 8)
+
+    shape_names, shapes = categorize(parsed[:, 0])
+    layer_lists, layers = categorize(parsed[:, 6])
+    numbers = parsed[:, [1, 2, 4, 5]].astype(float)[line]
+
+    # Fields on a pad's other lines override those on its first line.
+    optional = fields['optional']
+    optional = np.where(np.isnan(optional),
+                        optional_fields(parsed[:, 7], PAD_FIELDS)[line],
+                        optional)
+
+    # Pad positions are relative to, and rotated with, their module.
+    module = fields['module']
+    angle = np.radians(to_float(rows[:, 3], 0.0))[module]
+    cosine = np.cos(angle)
+    sine = np.sin(angle)
+    offset_x = numbers[:, 0]
+    offset_y = numbers[:, 1]
+
+    return {
+        'module': module,
+        'shape': shapes[line],
+        'shape_names': unquote_all(shape_names),
+        'x': to_float(rows[:, 1])[module] + offset_x * cosine +
+             offset_y * sine,
+        'y': to_float(rows[:, 2])[module] + offset_y * cosine -
+             offset_x * sine,
+        'rotation': to_float(parsed[:, 3], 0.0)[line],
+        'width': numbers[:, 2],
+        'height': numbers[:, 3],
+        'roundrect_ratio': np.nan_to_num(optional[:, 0]),
+        'solder_mask_margin': optional[:, 1],
+        'solder_paste_margin': optional[:, 2],
+        'solder_paste_ratio': optional[:, 3],
+        'layers': layers[line],
+        'layer_lists': [tuple(unquote(y) for y in x.split())
+                        for x in layer_lists],
+        'modules': modules,
+    }
+
+
+def zone_columns(fields):
+    """ Returns every copper zone as a dict holding its net, net name,
+    layer and list of filled polygons (each an (N, 2) array). """
+
+    zones = [{'net': int(x[0]), 'net_name': unquote(x[1]),
+              'layer': unquote(x[2]), 'polygons': []}
+             for x in fields['zones']]
+
+    for points, zone in zip(fields['points'], fields['zone']):
+        points = np.array(XY_REGEX.findall(points), dtype=bytes)
+        zones[zone]['polygons'].append(points.reshape(-1, 2).astype(float))
+
+    return zones
+
+
+# For each kind that scan_board reports: the item kinds it scans, how each
+# chunk's fields are converted, and how the final columns are built.
+BOARD_KINDS = {
+    'net': (['net'], net_fields, net_columns),
+    'segment': (['segment'], segment_fields, segment_columns),
+    'via': (['via'], via_fields, via_columns),
+    'pad': (['module', 'pad'], pad_fields, pad_columns),
+    'zone': (['zone', 'filled_polygon'], zone_fields, zone_columns),
+}
+
+
+def scan_board(data, *kinds):
+    """ Reads several kinds of item ('net', 'segment', 'via', 'pad' and
+    'zone') from the board data. Returns a dict mapping each kind to its
+    columns, as described by the matching *_columns function. """
+
+    # Top-level items alone are found much faster than along with nested
+    # ones, so the kinds without nested items get a pass of their own.
+    flat = [x for x in kinds
+            if not set(BOARD_KINDS[x][0]).intersection(ITEM_OWNERS)]
+    passes = [x for x in (flat, [x for x in kinds if x not in flat]) if x]
+    fields = dict((x, {}) for x in kinds)
+
+    for group in passes:
+        items = [y for x in group for y in BOARD_KINDS[x][0]]
+        for chunk in scan_items(data, items):
+            for kind in group:
+                for key, value in BOARD_KINDS[kind][1](chunk).items():
+                    fields[kind].setdefault(key, []).append(value)
+
+    result = {}
+    for kind in kinds:
+        columns = dict((x, np.concatenate(y))
+                       for x, y in fields[kind].items())
+        result[kind] = BOARD_KINDS[kind][2](columns)
+
+    return result
@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+
+""" Standalone command-line script for reporting per-net routing metrics on
+a KiCAD PCB: routed length (total and per layer), segment and via counts,
+layer changes and track-width statistics. Groups of nets can be checked for
+length matching. Reads the .kicad_pcb file directly (no pcbnew required)
+and computes every metric with batched NumPy operations grouped by net. """
+
+import argparse
+import os
+import re
+import sys
+
+import numpy as np
+
+import pcb_scan
+
+__version__ = "1.0"
+
+# Track endpoints and vias closer than this (in mm) are considered joined.
+JOIN_RESOLUTION = 1e-4
+
+
+def sanitize(path):
+    """ Runs a number of path transformations to clean up and normalize
+    an user-supplied path. """
+
+    path = os.path.expanduser(path)
+    path = os.path.expandvars(path)
+    path = os.path.normcase(path)
+    path = os.path.normpath(path)
+    path = os.path.abspath(path)
+    return path
+
+
+def layer_changes(segments, vias, net_count):
+    """ Counts, per net, the vias that actually join tracks on two or more
+    different layers. Via and track-endpoint positions are snapped to a
+    grid, hashed together with their net, and every track endpoint is looked
+    up among the vias with a sorted search. """
+
+    if len(vias['net']) == 0:
+        return np.zeros(net_count, dtype=np.intp)
+
+    def keys(x, y, net):
+        """ Builds (x, y, net) join key columns on the snapping grid, plus
+        a single 64-bit hash of each key. """
+        key = (np.round(x / JOIN_RESOLUTION).astype(np.int64),
+               np.round(y / JOIN_RESOLUTION).astype(np.int64),
+               net.astype(np.int64))
+        hashed = (key[0] * 73856093) ^ (key[1] * 19349663) ^ \
+            (key[2] * 83492791)
+        return key, hashed
+
+    via_keys, via_hashes = keys(vias['x'], vias['y'], vias['net'])
+    order = np.argsort(via_hashes)
+    sorted_hashes = via_hashes[order]
+    masks = np.zeros(len(via_hashes), dtype=np.int64)
+
+    # Start and end points are matched in turn to keep the temporaries at
+    # one column's worth of endpoints.
+    for end in ("1", "2"):
+        end_keys, end_hashes = keys(segments['x' + end],
+                                    segments['y' + end], segments['net'])
+        slots = np.searchsorted(sorted_hashes, end_hashes)
+        slots = np.minimum(slots, len(order) - 1)
+        matched = order[slots]
+
+        # Hash collisions are weeded out by comparing the full keys.
+        hit = sorted_hashes[slots] == end_hashes
+        for via_key, end_key in zip(via_keys, end_keys):
+            hit &= via_key[matched] == end_key
+
+        np.bitwise_or.at(masks, matched[hit],
+                         np.left_shift(1, segments['layer'][hit]))
+
+    layers_joined = np.zeros(len(masks), dtype=np.intp)
+    while masks.any():
+        layers_joined += (masks & 1).astype(np.intp)
+        masks >>= 1
+
+    changes = (layers_joined >= 2).astype(np.intp)
+    return np.bincount(vias['net'], weights=changes,
+                       minlength=net_count).astype(np.intp)
+
+
+def compute_metrics(data):
+    """ Computes per-net routing metrics from the board file's contents
+    (see pcb_scan.read_board_data). Returns a (copper_layers, metrics)
+    tuple, where 'metrics' is a list of dicts, one per routed net, ordered
+    by net name. """
+
+    copper_layers = pcb_scan.scan_copper_layers(data)
+    board = pcb_scan.scan_board(data, "net", "segment", "via")
+    nets = board['net']
+    segments = board['segment']
+    vias = board['via']
+
+    # Re-index segment layers from the names actually used to the stack.
+    layer_index = np.array([copper_layers.index(x)
+                            for x in segments['layer_names']], dtype=np.intp)
+    segments['layer'] = layer_index[segments['layer']]
+
+    net_count = max(list(nets.keys()) + [0]) + 1
+    layer_count = len(copper_layers)
+    net = segments['net']
+
+    lengths = np.hypot(segments['x2'] - segments['x1'],
+                       segments['y2'] - segments['y1'])
+
+    total = np.bincount(net, weights=lengths, minlength=net_count)
+    count = np.bincount(net, minlength=net_count)
+    per_layer = np.bincount(net * layer_count + segments['layer'],
+                            weights=lengths,
+                            minlength=net_count * layer_count)
+    per_layer = per_layer.reshape(net_count, layer_count)
+    weighted_width = np.bincount(net, weights=lengths * segments['width'],
+                                 minlength=net_count)
+
+    min_width = np.full(net_count, np.inf)
+    max_width = np.zeros(net_count)
+    np.minimum.at(min_width, net, segments['width'])
+    np.maximum.at(max_width, net, segments['width'])
+
+    via_count = np.bincount(vias['net'], minlength=net_count)
+    changes = layer_changes(segments, vias, net_count)
+
+    metrics = []
+    for code in np.nonzero((count > 0) | (via_count > 0))[0]:
+        metrics.append({
+            'net': nets.get(int(code), str(code)),
+            'length': total[code],
+            'layer_lengths': per_layer[code].tolist(),
+            'segments': int(count[code]),
+            'vias': int(via_count[code]),
+            'layer_changes': int(changes[code]),
+            'min_width': min_width[code] if count[code] else 0.0,
+            'max_width': max_width[code],
+            'mean_width': weighted_width[code] / total[code]
+                          if total[code] > 0 else 0.0,
+        })
+
+    return copper_layers, sorted(metrics, key=lambda x: x['net'])
+
+
+def check_groups(metrics, groups, tolerance):
+    """ Checks each matched-length group of nets. Returns a list of
+    (group, [(net, length)], spread, passed, missing) tuples, where
+    'missing' lists group members that aren't routed nets on the board. A
+    group with missing members never passes. """
+
+    lengths = {}
+    for metric in metrics:
+        lengths[metric['net']] = metric['length']
+        lengths[metric['net'].lstrip("/")] = metric['length']
+
+    results = []
+    for group in groups:
+        members = []
+        missing = []
+        for name in group:
+            length = lengths.get(name, lengths.get(name.lstrip("/")))
+            if length is None:
+                missing.append(name)
+            else:
+                members.append((name, length))
+
+        values = [x[1] for x in members]
+        spread = max(values) - min(values) if values else 0.0
+        passed = not missing and spread <= tolerance
+        results.append((group, members, spread, passed, missing))
+
+    return results
+
+
+def print_metrics(copper_layers, metrics):
+    """ Prints the per-net metrics table (lengths and widths in mm). """
+
+    layer_headers = "".join(" %10s" % x for x in copper_layers)
+    sys.stdout.write("%-24s %10s%s %6s %5s %6s %7s %7s %7s\n" %
+                     ("Net", "Length", layer_headers, "Segs", "Vias",
+                      "Layer+", "MinW", "MaxW", "AvgW"))
+
+    for metric in metrics:
+        layer_lengths = "".join(" %10.3f" % x
+                                for x in metric['layer_lengths'])
+        sys.stdout.write("%-24s %10.3f%s %6d %5d %6d %7.4f %7.4f %7.4f\n" %
+                         (metric['net'], metric['length'], layer_lengths,
+                          metric['segments'], metric['vias'],
+                          metric['layer_changes'], metric['min_width'],
+                          metric['max_width'], metric['mean_width']))
+
+
+def make_parser():
+    """ Creates the CLI's argparse instance. """
+
+    description = """Script for reporting per-net routing metrics (length,
+    per-layer length, via count, layer changes and track widths) for a KiCAD
+    PCB, and for checking groups of nets for length matching. """
+
+    parser = argparse.ArgumentParser(description=description)
+
+    parser.add_argument('pcb_file', metavar="PCB_FILE",
+                        help="Target .kicad_pcb file to analyze.")
+
+    parser.add_argument('-q', '--quiet', default=False, action="store_true",
+                        help="Only print length-matching results.")
+
+    parser.add_argument('-n', '--nets', default='',
+                        help="Only report nets matching this regex.")
+
+    parser.add_argument('-g', '--group', action="append", default=[],
+                        help="Comma-separated list of nets that must be " +
+                        "length-matched. May be given more than once.")
+
+    parser.add_argument('-t', '--tolerance', default=0.5, type=float,
+                        help="Allowed length spread within a group, in mm " +
+                        "(default: 0.5)")
+
+    version_string = "%(prog)s" + " v%s" % __version__
+    parser.add_argument('--version', action='version', version=version_string)
+
+    parser.epilog = """Copyright 2017, Nicholas Clark."""
+    return parser
+
+
+def main():
+    """ Main function for this script. """
+
+    parser = make_parser()
+    args = parser.parse_args()
+    args.pcb_file = sanitize(args.pcb_file)
+
+    if not os.access(args.pcb_file, os.R_OK):
+        sys.stderr.write("Error: can't open file [%s]\n" % args.pcb_file)
+        sys.exit(1)
+
+    data = pcb_scan.read_board_data(args.pcb_file)
+    copper_layers, metrics = compute_metrics(data)
+
+    if not args.quiet:
+        shown = [x for x in metrics if re.search(args.nets, x['net'])]
+        print_metrics(copper_layers, shown)
+
+    groups = [[y.strip() for y in x.split(",") if y.strip() != ""]
+              for x in args.group]
+    groups = [x for x in groups if x]
+    failed = False
+
+    for group, members, spread, passed, missing in check_groups(
+            metrics, groups, args.tolerance):
+        for name in missing:
+            sys.stderr.write("Error: net [%s] in length group [%s] not " %
+                             (name, ",".join(group)) + "found on the board.\n")
+
+        status = "OK" if passed else "FAIL"
+        lengths = ", ".join(["%s=%.3f" % x for x in members] +
+                            ["%s=missing" % x for x in missing])
+        sys.stdout.write("Length group [%s]: spread %.3f mm (%s)\n" %
+                         (lengths, spread, status))
+        failed = failed or not passed
+
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()